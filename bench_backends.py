@@ -0,0 +1,60 @@
+"""Compare executor backends on a synthetic corpus of TD workbooks
+
+    python bench_backends.py [file_counts] [rows_per_sheet] [workers]
+
+file_counts is one count or several separated by commas (e.g. 32,128,500);
+each gets its own corpus, and the line for it shows which backend was
+fastest and which one "auto" would pick, so the THREAD_BACKEND_* crossover
+in scanner.py can be checked on the machine at hand. Record the CPU count
+with any numbers quoted.
+
+Workers are started with the "spawn" method, as on Windows, so the process
+backend pays the same startup cost it does for users of the packaged exe.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+from scanner import scan, ScanOptions, available_backends, select_backend
+
+def make_corpus(root, file_count, rows):
+    for i in range(file_count):
+        wb = Workbook()
+        ws = wb.active
+        for r in range(rows):
+            ws.append([f"api{i}_{r}", r, f"description {r}"])
+        wb.save(os.path.join(root, f"TD_{i:05d}.xlsx"))
+
+def corpus_bytes(root):
+    return sum(entry.stat().st_size for entry in os.scandir(root))
+
+def run(root, backend, workers):
+    options = ScanOptions(backend=backend, max_workers=workers)
+    start = time.perf_counter()
+    count = sum(1 for _ in scan(root, ["orgEmpCertDetail"], options))
+    return count, time.perf_counter() - start
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")
+    file_counts = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [200]
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else min(4, multiprocessing.cpu_count())
+
+    print(f"{rows} rows per sheet, {workers} worker(s), "
+          f"{multiprocessing.cpu_count()} CPU(s), Python {sys.version.split()[0]}")
+    for file_count in file_counts:
+        with tempfile.TemporaryDirectory() as root:
+            make_corpus(root, file_count, rows)
+            timings = {}
+            for backend in available_backends():
+                count, elapsed = run(root, backend, workers)
+                timings[backend] = elapsed
+                print(f"  {file_count:>6} files  {backend:<12} {elapsed:7.2f} s  "
+                      f"{count / elapsed:8.1f} files/s")
+            auto = select_backend("auto", file_count, corpus_bytes(root), workers)
+            print(f"  {file_count:>6} files  fastest: {min(timings, key=timings.get)}, "
+                  f"auto picks: {auto}")
@@ -0,0 +1,65 @@
+"""Check that split (per-sheet) scans find exactly what whole-file scans find
+
+    python check_split_parity.py [backend]
+
+Builds multi-sheet TD workbooks covering the cell encodings the two paths
+read differently (shared and inline strings, formula results, numbers,
+serial and ISO 8601 dates, booleans, errors), scans them with splitting
+off and with every workbook split, in values and formulas mode, and
+reports any file whose found targets, locations or error differ. Exits
+with status 1 on a mismatch.
+"""
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+
+from openpyxl import Workbook
+
+from scanner import scan, ScanOptions
+
+TARGETS = ["orgEmpCertDetail", "sheet two", "20231015", "3.14", "2023-10-15",
+           "2024-02-29", "100..200", "2024-01-01..", "#N/A", "TRUE"]
+
+# Splits every workbook with at least two sheets
+SPLIT_ALL_MB = 1 / (1024 * 1024)
+
+def make_corpus(root):
+    for iso_dates in (False, True):
+        wb = Workbook(iso_dates=iso_dates)
+        ws = wb.active
+        ws.append(["orgEmpCertDetail", 20231015, 3.14, datetime.datetime(2023, 10, 15, 9, 30)])
+        ws.append([True, "=NA()", "=CONCATENATE(\"sheet \", \"two\")", None])
+        second = wb.create_sheet("Second")
+        for r in range(500):
+            second.append([f"row {r}", r, r * 0.5])
+        second.append(["sheet two", datetime.date(2024, 2, 29)])
+        wb.save(os.path.join(root, f"TD_parity_{'iso' if iso_dates else 'serial'}.xlsx"))
+
+    # Only one sheet: never split, but must scan the same either way
+    wb = Workbook()
+    wb.active.append(["sheet two", 150])
+    wb.save(os.path.join(root, "TD_parity_single.xlsx"))
+
+def outcomes(root, mode, split_mb, backend):
+    options = ScanOptions(mode=mode, split_threshold_mb=split_mb, backend=backend)
+    return {os.path.basename(r.file): (sorted(r.found), r.matched_in, r.error)
+            for r in scan(root, TARGETS, options)}
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")
+    backend = sys.argv[1] if len(sys.argv) > 1 else "thread"
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as root:
+        make_corpus(root)
+        for mode in ("values", "formulas"):
+            whole = outcomes(root, mode, 0, backend)
+            split = outcomes(root, mode, SPLIT_ALL_MB, backend)
+            for name in sorted(whole):
+                same = whole[name] == split.get(name)
+                mismatches += not same
+                print(f"{mode:<9} {name:<26} {'ok' if same else 'MISMATCH'}")
+                if not same:
+                    print(f"  whole: {whole[name]}\n  split: {split.get(name)}")
+    sys.exit(1 if mismatches else 0)
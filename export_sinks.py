@@ -0,0 +1,150 @@
+"""Export sinks that write scan results to disk while the scan runs
+
+A sink is opened before the scan and given every ScanResult as it arrives,
+so nothing is kept in memory. JSONL and CSV rows are appended and flushed
+by tick(), which the caller runs from the scan's progress callback, so a
+crash or cancel loses at most the last FLUSH_INTERVAL seconds even while
+no new results arrive. The XLSX report streams rows through openpyxl's
+write_only mode and is only readable once the sink is closed.
+"""
+import csv
+import json
+import os
+import time
+from dataclasses import asdict
+
+# Seconds between flushes of buffered rows to disk
+FLUSH_INTERVAL = 2.0
+
+COLUMNS = ["File Path", "Target", "Found In", "Sheet", "Cell", "Text", "Error"]
+
+def result_rows(result):
+    """Flatten a ScanResult into COLUMNS rows: one per matching cell, else per target and location
+
+    Files without matches or errors produce no rows, and with a query so
+    do files that do not satisfy it.
+    """
+    if result.error:
+        yield [result.file, "", "", "", "", "", result.error]
+        return
+    if result.query_match is False:
+        return
+    if result.query_match and not result.found:
+        # Matched a query such as NOT A without containing any term
+        yield [result.file, "", "", "", "", "", ""]
+        return
+
+    detailed = set()
+    for target, sheet, cell, found_in, text in result.cells:
+        detailed.add(target)
+        yield [result.file, target, found_in, sheet, cell, text, ""]
+    # Targets past the per-file detail limit still get a summary row
+    for target in sorted(set(result.found) - detailed):
+        for found_in in result.matched_in.get(target, ["value"]):
+            yield [result.file, target, found_in, "", "", "", ""]
+
+class ResultSink:
+    """Base sink: write() each ScanResult, tick() periodically, close() when the scan ends"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._pending = False
+        self._last_flush = time.monotonic()
+
+    def write(self, result):
+        self._write(result)
+        self.count += 1
+        self._pending = True
+        self.tick()
+
+    def tick(self):
+        """Flush rows written since the last flush once FLUSH_INTERVAL has passed"""
+        now = time.monotonic()
+        if self._pending and now - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+            self._pending = False
+            self._last_flush = now
+
+    def _write(self, result):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class JsonlSink(ResultSink):
+    """One JSON object per scanned file, including files without matches"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _write(self, result):
+        self._file.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class CsvSink(ResultSink):
+    """One row per matching cell (or per target and location without cell details)"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        # utf-8-sig so Excel detects the encoding, as in the GUI's CSV export
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def _write(self, result):
+        self._writer.writerows(result_rows(result))
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class XlsxSink(ResultSink):
+    """CSV rows in an .xlsx report, streamed through openpyxl's write_only mode"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        self._illegal = ILLEGAL_CHARACTERS_RE
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Results")
+        self._sheet.append(COLUMNS)
+
+    def _write(self, result):
+        for row in result_rows(result):
+            # Control characters in cell text are not allowed in the XML
+            self._sheet.append([self._illegal.sub("", value) for value in row])
+
+    def close(self):
+        self._workbook.save(self.path)
+
+SINKS = {
+    ".jsonl": JsonlSink,
+    ".csv": CsvSink,
+    ".xlsx": XlsxSink,
+}
+
+def open_sink(path):
+    """Open the sink matching the file extension of path (.jsonl, .csv or .xlsx)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"Unsupported export format: {extension or path}")
+    return SINKS[extension](path)
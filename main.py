@@ -1,14 +1,16 @@
 import os
 import tkinter as tk
 from tkinter import filedialog, scrolledtext, messagebox, ttk
-from openpyxl import load_workbook
 import threading
-from concurrent.futures import ProcessPoolExecutor, as_completed
 import multiprocessing
-import re
 import sys
 import json
 from pathlib import Path
+import heapq
+from scanner import (scan, ScanOptions, CancelToken, CheckpointError, WorkerPool,
+                     read_target_file, auto_picks_threads)
+from export_sinks import open_sink, SINKS
+from query import QueryPlan, QueryError
 
 def is_dark_mode():
     """Detect if system is in dark mode (Windows only)"""
@@ -25,62 +27,63 @@ def is_dark_mode():
             return False
     return False
 
-def scan_single_file(file_path, targets_set, case_sensitive=False, use_regex=False):
-    """Scan a single Excel file for target strings - optimized version"""
-    try:
-        # Use read_only=True for faster loading and lower memory usage
-        wb = load_workbook(file_path, data_only=True, read_only=True)
-        found_targets = set()
-
-        for sheet in wb.sheetnames:
-            # Early exit if all targets found
-            if found_targets == targets_set:
-                break
-
-            ws = wb[sheet]
-            for row in ws.iter_rows(values_only=True):
-                # Early exit if all targets found
-                if found_targets == targets_set:
-                    break
-
-                for cell in row:
-                    if isinstance(cell, str):
-                        for t in targets_set:
-                            # Apply search options
-                            match_found = False
-
-                            if use_regex:
-                                try:
-                                    flags = 0 if case_sensitive else re.IGNORECASE
-                                    if re.search(t, cell, flags):
-                                        match_found = True
-                                except re.error:
-                                    # Invalid regex, fall back to literal search
-                                    cell_cmp = cell if case_sensitive else cell.lower()
-                                    t_cmp = t if case_sensitive else t.lower()
-                                    if t_cmp in cell_cmp:
-                                        match_found = True
-                            else:
-                                # Literal search
-                                cell_cmp = cell if case_sensitive else cell.lower()
-                                t_cmp = t if case_sensitive else t.lower()
-                                if t_cmp in cell_cmp:
-                                    match_found = True
-
-                            if match_found:
-                                found_targets.add(t)
-                                # Early exit if all targets found
-                                if found_targets == targets_set:
-                                    break
-
-        wb.close()
-
-        if found_targets:
-            return {"file": file_path, "found": list(found_targets)}
-        return None
-
-    except Exception as e:
-        return {"file": file_path, "error": str(e)}
+# Scan modes offered in the UI, by label
+SCAN_MODE_LABELS = {
+    "Values": "values",
+    "Values + Formulas": "formulas",
+    "Metadata Only": "metadata",
+}
+
+# Target lists longer than this are saved to a separate file instead of the config
+INLINE_TARGET_LIMIT = 100
+
+def format_found(result):
+    """Found targets, marking the ones seen somewhere other than a cell value"""
+    items = []
+    for target in sorted(result.found):
+        where = result.matched_in.get(target, ["value"])
+        items.append(target if where == ["value"] else f"{target} ({', '.join(where)})")
+    # A query can match without any term present, e.g. NOT A
+    return ", ".join(items) or "(query matched, no terms present)"
+
+def format_target_summary(results, targets):
+    """Per-target file counts, including targets that were never found"""
+    target_counts = dict.fromkeys(targets, 0)
+    for r in results:
+        for target in r.found:
+            target_counts[target] = target_counts.get(target, 0) + 1
+
+    found = sorted((t, c) for t, c in target_counts.items() if c)
+    missing = [t for t, c in target_counts.items() if not c]
+
+    text = ""
+    if found:
+        text += f"Matches by target ({len(found)}/{len(target_counts)}):\n"
+        for target, count in found:
+            text += f"  • {target}: {count} file(s)\n"
+    if missing:
+        text += f"\nNot found ({len(missing)}/{len(target_counts)}):\n"
+        for target in missing:
+            text += f"  • {target}\n"
+    return text
+
+# Files listed in the peak memory summary
+MEMORY_SUMMARY_LIMIT = 5
+
+def format_memory_summary(memory_stats, limit=MEMORY_SUMMARY_LIMIT):
+    """Files with the highest measured peak worker memory, next to their estimates
+
+    memory_stats holds (peak, file_path, estimate) entries.
+    """
+    measured = sorted(memory_stats, reverse=True)
+    if not measured:
+        return ""
+
+    mb = 1024 * 1024
+    text = f"\nPeak worker memory (top {min(limit, len(measured))}):\n"
+    for peak, file_path, estimate in measured[:limit]:
+        text += f"  • {peak / mb:.0f} MB (est. {estimate / mb:.0f} MB) - {os.path.basename(file_path)}\n"
+    return text
 
 class TDScannerGUI:
     def __init__(self, root):
@@ -356,8 +359,11 @@ class TDScannerGUI:
             }
         }
 
-        # Settings file path
+        # Settings file paths
         self.config_file = Path.home() / ".tdscanner_config.json"
+        self.targets_file = Path.home() / ".tdscanner_targets.json"
+        self.discovery_cache_file = Path.home() / ".tdscanner_discovery_cache.json"
+        self.checkpoint_file = Path.home() / ".tdscanner_checkpoint.jsonl"
 
         # Load settings or use defaults
         settings = self.load_settings()
@@ -370,24 +376,76 @@ class TDScannerGUI:
         else:
             self.current_theme = "Clean Studio"
 
-        self.target_entries = []  # List to store target entry widgets
-        self.scan_cancelled = False
-        self.executor = None
+        self.targets = []  # Search targets, in the order shown in the list
+        self.scan_token = None
         self.last_directory = settings.get("last_directory", r"D:\DreamSVN\Dream_Doc\1.ProgramSpec\X.Version\3.0")
-        self.saved_targets = settings.get("targets", ["orgEmpCertDetail"])
+        self.saved_targets = self.load_saved_targets(settings)
         self.case_sensitive_var = tk.BooleanVar(value=settings.get("case_sensitive", False))
         self.use_regex_var = tk.BooleanVar(value=settings.get("use_regex", False))
+        mode_labels = {mode: label for label, mode in SCAN_MODE_LABELS.items()}
+        self.scan_mode_var = tk.StringVar(value=mode_labels.get(settings.get("scan_mode"), "Values"))
+        # Read-ahead I/O stage (0 threads disables it)
+        self.read_ahead_threads = settings.get("read_ahead_threads", 4)
+        self.read_ahead_mb = settings.get("read_ahead_mb", 256)
+        # Memory budget for concurrent parses (0 = half of installed RAM)
+        self.memory_budget_mb = settings.get("memory_budget_mb", 0)
+        # Executor backend: auto, process, thread or interpreter
+        self.executor_backend = settings.get("executor_backend", "auto")
+        # Also scan TD workbooks inside .zip archives
+        self.scan_archives = settings.get("scan_archives", True)
+        # Reuse directory listings of unchanged folders between scans
+        self.discovery_cache = settings.get("discovery_cache", True)
+        self.refresh_discovery_var = tk.BooleanVar(value=False)
+        # Workbooks at least this large are searched sheet by sheet in parallel (0 disables)
+        self.split_threshold_mb = settings.get("split_threshold_mb", 32)
+        # File that results are written to while the scan runs (empty = off)
+        self.stream_export = settings.get("stream_export", "")
+        # Also stream every matching cell (sheet, cell, text); files are then read
+        # to the end instead of stopping once the targets are found, so scans are slower
+        self.cell_details_var = tk.BooleanVar(value=settings.get("cell_details", False))
+        # Boolean query over targets; when set it replaces the target list
+        self.saved_query = settings.get("query", "")
+        # Journal scan progress so an interrupted scan can be resumed
+        self.checkpoint = settings.get("checkpoint", True)
+        # Low-impact scanning: background priority, CPU cap (% of all cores)
+        # and read-ahead bandwidth cap (MB/s, 0 = no cap)
+        self.background_mode_var = tk.BooleanVar(value=settings.get("background_mode", False))
+        self.cpu_limit_percent = settings.get("cpu_limit_percent", 50)
+        self.read_limit_mb = settings.get("read_limit_mb", 32)
+        # Worker processes per scan, kept alive between scans unless worker_pool is off
+        self.max_workers = settings.get("max_workers", min(4, multiprocessing.cpu_count()))
+        self.keep_workers = settings.get("worker_pool", True)
+        self.worker_pool = WorkerPool() if self.keep_workers else None
         self.apply_theme()
         self.create_widgets()
 
         # Save settings on window close
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        # Start the workers once the window is up, so the first scan finds them ready
+        self.root.after(500, self.warm_up_workers)
+
     def on_closing(self):
         """Handle window close event"""
         self.save_settings()
+        if self.scan_token:
+            self.scan_token.cancel()
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
         self.root.destroy()
 
+    def warm_up_workers(self):
+        """Spawn the worker pool in the background (it imports openpyxl once per worker)"""
+        if self.worker_pool is None or self.executor_backend not in ("auto", "process"):
+            return
+        options = ScanOptions(max_workers=self.max_workers,
+                              background=self.background_mode_var.get(),
+                              cpu_limit_percent=self.cpu_limit_percent)
+        if self.executor_backend == "auto" and auto_picks_threads(options.worker_count()):
+            # e.g. one CPU: scans never use the pool, so don't start it
+            return
+        threading.Thread(target=self.worker_pool.warm_up, args=(options,), daemon=True).start()
+
     def load_settings(self):
         """Load settings from config file"""
         try:
@@ -398,24 +456,56 @@ class TDScannerGUI:
             print(f"Failed to load settings: {e}")
         return {}
 
+    def load_saved_targets(self, settings):
+        """Load targets from the config, or from the target list file for long lists"""
+        targets_file = settings.get("targets_file")
+        if targets_file:
+            try:
+                with open(targets_file, 'r', encoding='utf-8') as f:
+                    if targets_file.endswith(".json"):
+                        return json.load(f)
+                    # One per line, as older versions saved it; no comment lines, since
+                    # targets such as #N/A start with "#"
+                    return [line.strip() for line in f if line.strip()]
+            except Exception as e:
+                print(f"Failed to load targets: {e}")
+        return settings.get("targets", ["orgEmpCertDetail"])
+
     def save_settings(self):
         """Save current settings to config file"""
         try:
-            # Collect current targets
-            targets = []
-            for entry in self.target_entries:
-                target = entry.get().strip()
-                if target:
-                    targets.append(target)
-
             settings = {
                 "theme": self.current_theme,
                 "last_directory": self.dir_entry.get().strip(),
-                "targets": targets,
                 "case_sensitive": self.case_sensitive_var.get(),
-                "use_regex": self.use_regex_var.get()
+                "use_regex": self.use_regex_var.get(),
+                "scan_mode": SCAN_MODE_LABELS[self.scan_mode_var.get()],
+                "read_ahead_threads": self.read_ahead_threads,
+                "read_ahead_mb": self.read_ahead_mb,
+                "memory_budget_mb": self.memory_budget_mb,
+                "executor_backend": self.executor_backend,
+                "scan_archives": self.scan_archives,
+                "discovery_cache": self.discovery_cache,
+                "split_threshold_mb": self.split_threshold_mb,
+                "stream_export": self.stream_entry.get().strip(),
+                "cell_details": self.cell_details_var.get(),
+                "query": self.query_entry.get().strip(),
+                "checkpoint": self.checkpoint,
+                "background_mode": self.background_mode_var.get(),
+                "cpu_limit_percent": self.cpu_limit_percent,
+                "read_limit_mb": self.read_limit_mb,
+                "max_workers": self.max_workers,
+                "worker_pool": self.keep_workers
             }
 
+            # Long target lists go to a separate JSON file to keep the config small
+            if len(self.targets) > INLINE_TARGET_LIMIT:
+                with open(self.targets_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.targets, f, ensure_ascii=False)
+                settings["targets_file"] = str(self.targets_file)
+            else:
+                settings["targets"] = self.targets
+
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(settings, f, indent=2, ensure_ascii=False)
         except Exception as e:
@@ -464,12 +554,21 @@ class TDScannerGUI:
 
         self.controls.config(bg=self.bg_tertiary, relief=self.relief_style)
         self.target_main_frame.config(bg=self.bg_tertiary)
-        self.targets_container.config(bg=self.bg_tertiary)
-        self.targets_canvas.config(bg=self.bg_tertiary)
         self.target_label.config(text=self.label_targets, bg=self.bg_tertiary,
                                 fg=self.text_color, font=self.font_main)
+        self.target_entry.config(bg=self.entry_bg, fg=self.entry_fg, font=self.font_main)
         self.add_target_btn.config(bg=self.accent, fg=self.btn_fg,
                                   font=self.font_main, relief=self.relief_style)
+        self.import_targets_btn.config(bg=self.accent, fg=self.btn_fg,
+                                      font=self.font_main, relief=self.relief_style)
+        self.target_listbox.config(bg=self.entry_bg, fg=self.entry_fg, font=self.font_main)
+        self.target_header.config(bg=self.bg_tertiary)
+        self.target_list_frame.config(bg=self.bg_tertiary)
+        self.target_footer.config(bg=self.bg_tertiary)
+        self.target_count_label.config(bg=self.bg_tertiary, fg=self.text_color,
+                                      font=self.font_main)
+        self.remove_target_btn.config(font=self.font_main, relief=self.relief_style)
+        self.clear_targets_btn.config(font=self.font_main, relief=self.relief_style)
 
         # Update search options
         self.options_frame.config(bg=self.bg_tertiary)
@@ -481,18 +580,20 @@ class TDScannerGUI:
                                font=self.font_main, selectcolor=self.entry_bg,
                                activebackground=self.bg_tertiary,
                                activeforeground=self.text_color)
+        self.refresh_check.config(bg=self.bg_tertiary, fg=self.text_color,
+                                  font=self.font_main, selectcolor=self.entry_bg,
+                                  activebackground=self.bg_tertiary,
+                                  activeforeground=self.text_color)
+        self.background_check.config(bg=self.bg_tertiary, fg=self.text_color,
+                                     font=self.font_main, selectcolor=self.entry_bg,
+                                     activebackground=self.bg_tertiary,
+                                     activeforeground=self.text_color)
+        self.mode_label.config(bg=self.bg_tertiary, fg=self.text_color, font=self.font_main)
+        self.mode_selector.config(font=self.font_main)
 
         # Update buttons
         self.btn_frame.config(bg=self.bg_tertiary)
 
-        # Update all target entry frames
-        for entry in self.target_entries:
-            entry.master.config(bg=self.bg_tertiary)
-            entry.config(bg=self.entry_bg, fg=self.entry_fg, font=self.font_main)
-            for widget in entry.master.winfo_children():
-                if isinstance(widget, tk.Label):
-                    widget.config(bg=self.bg_tertiary, fg=self.text_color, font=self.font_main)
-
         self.dir_frame.config(bg=self.bg_tertiary)
         self.dir_label.config(text=self.label_directory, bg=self.bg_tertiary,
                              fg=self.text_color, font=self.font_main)
@@ -500,8 +601,20 @@ class TDScannerGUI:
         self.browse_btn.config(text=self.btn_browse, bg=self.accent, fg=self.btn_fg,
                               font=self.font_main, relief=self.relief_style)
 
+        self.stream_frame.config(bg=self.bg_tertiary)
+        self.stream_label.config(bg=self.bg_tertiary, fg=self.text_color, font=self.font_main)
+        self.stream_entry.config(bg=self.entry_bg, fg=self.entry_fg, font=self.font_main)
+        self.stream_browse_btn.config(bg=self.accent, fg=self.btn_fg,
+                                      font=self.font_main, relief=self.relief_style)
+
+        self.query_frame.config(bg=self.bg_tertiary)
+        self.query_label.config(bg=self.bg_tertiary, fg=self.text_color, font=self.font_main)
+        self.query_entry.config(bg=self.entry_bg, fg=self.entry_fg, font=self.font_main)
+
         self.scan_btn.config(text=self.btn_scan, bg=self.accent, fg=self.btn_fg,
                             font=self.font_main, relief=self.relief_style)
+        self.resume_btn.config(bg=self.accent, fg=self.btn_fg,
+                              font=self.font_main, relief=self.relief_style)
 
         self.progress_frame.config(bg=self.bg_tertiary)
 
@@ -555,56 +668,72 @@ class TDScannerGUI:
         self.target_main_frame.pack(pady=10, fill="x")
 
         # Header with label and add button
-        target_header = tk.Frame(self.target_main_frame, bg=self.bg_tertiary)
-        target_header.pack(fill="x", padx=5)
+        self.target_header = tk.Frame(self.target_main_frame, bg=self.bg_tertiary)
+        self.target_header.pack(fill="x", padx=5)
 
-        self.target_label = tk.Label(target_header, text=self.label_targets,
+        self.target_label = tk.Label(self.target_header, text=self.label_targets,
                                      font=self.font_main, bg=self.bg_tertiary,
                                      fg=self.text_color)
         self.target_label.pack(side="left", padx=5)
 
-        self.add_target_btn = tk.Button(target_header, text="+ Add Target",
-                                        command=self.add_target_field,
+        self.target_entry = tk.Entry(self.target_header, width=30, font=self.font_main,
+                                     bg=self.entry_bg, fg=self.entry_fg, bd=3)
+        self.target_entry.bind("<Return>", lambda event: self.add_target_from_entry())
+        self.target_entry.pack(side="left", padx=5)
+
+        self.add_target_btn = tk.Button(self.target_header, text="+ Add Target",
+                                        command=self.add_target_from_entry,
                                         font=self.font_main, bg=self.accent,
                                         fg=self.btn_fg, bd=2, relief=self.relief_style,
                                         cursor="hand2")
         self.add_target_btn.pack(side="left", padx=5)
 
-        # Scrollable container for target entries
-        scroll_frame = tk.Frame(self.target_main_frame, bg=self.bg_tertiary)
-        scroll_frame.pack(fill="both", padx=5, pady=5, expand=False)
-
-        # Canvas for scrolling
-        self.targets_canvas = tk.Canvas(scroll_frame, bg=self.bg_tertiary,
-                                        height=150, highlightthickness=0)
-        self.targets_scrollbar = tk.Scrollbar(scroll_frame, orient="vertical",
-                                             command=self.targets_canvas.yview)
-
-        # Frame inside canvas
-        self.targets_container = tk.Frame(self.targets_canvas, bg=self.bg_tertiary)
-
-        # Configure canvas
-        self.targets_canvas.configure(yscrollcommand=self.targets_scrollbar.set)
-
-        # Pack scrollbar and canvas
+        self.import_targets_btn = tk.Button(self.target_header, text="Import...",
+                                            command=self.import_targets,
+                                            font=self.font_main, bg=self.accent,
+                                            fg=self.btn_fg, bd=2, relief=self.relief_style,
+                                            cursor="hand2")
+        self.import_targets_btn.pack(side="left", padx=5)
+
+        # Compact list of targets - one Listbox row each, however many there are
+        self.target_list_frame = tk.Frame(self.target_main_frame, bg=self.bg_tertiary)
+        self.target_list_frame.pack(fill="both", padx=5, pady=5, expand=False)
+
+        self.targets_scrollbar = tk.Scrollbar(self.target_list_frame, orient="vertical")
+        self.target_listbox = tk.Listbox(self.target_list_frame, height=6, font=self.font_main,
+                                         bg=self.entry_bg, fg=self.entry_fg,
+                                         selectmode="extended", activestyle="none",
+                                         yscrollcommand=self.targets_scrollbar.set)
+        self.targets_scrollbar.config(command=self.target_listbox.yview)
         self.targets_scrollbar.pack(side="right", fill="y")
-        self.targets_canvas.pack(side="left", fill="both", expand=True)
-
-        # Create window in canvas
-        self.canvas_frame = self.targets_canvas.create_window((0, 0),
-                                                              window=self.targets_container,
-                                                              anchor="nw")
-
-        # Bind configuration
-        self.targets_container.bind("<Configure>", self.on_targets_configure)
-        self.targets_canvas.bind("<Configure>", self.on_canvas_configure)
-
-        # Bind mousewheel for scrolling
-        self.targets_canvas.bind_all("<MouseWheel>", self.on_mousewheel)
-
-        # Add saved target fields
-        for target in self.saved_targets:
-            self.add_target_field(target)
+        self.target_listbox.pack(side="left", fill="both", expand=True)
+        self.target_listbox.bind("<Delete>", lambda event: self.remove_selected_targets())
+        self.target_listbox.bind("<Double-Button-1>", lambda event: self.edit_selected_target())
+
+        self.target_footer = tk.Frame(self.target_main_frame, bg=self.bg_tertiary)
+        self.target_footer.pack(fill="x", padx=5)
+
+        self.target_count_label = tk.Label(self.target_footer, text="",
+                                           font=self.font_main, bg=self.bg_tertiary,
+                                           fg=self.text_color)
+        self.target_count_label.pack(side="left", padx=5)
+
+        self.clear_targets_btn = tk.Button(self.target_footer, text="Clear",
+                                           command=self.clear_targets,
+                                           font=self.font_main, bg="#FF6347",
+                                           fg="white", bd=2, relief=self.relief_style,
+                                           cursor="hand2")
+        self.clear_targets_btn.pack(side="right", padx=2)
+
+        self.remove_target_btn = tk.Button(self.target_footer, text="✖ Remove Selected",
+                                           command=self.remove_selected_targets,
+                                           font=self.font_main, bg="#FF6347",
+                                           fg="white", bd=2, relief=self.relief_style,
+                                           cursor="hand2")
+        self.remove_target_btn.pack(side="right", padx=2)
+
+        # Add saved targets
+        self.add_targets(self.saved_targets)
 
         # Directory Selection
         self.dir_frame = tk.Frame(self.controls, bg=self.bg_tertiary)
@@ -627,6 +756,51 @@ class TDScannerGUI:
                                     cursor="hand2")
         self.browse_btn.pack(side="left", padx=5)
 
+        # Streaming export: results are written to this file as they arrive
+        self.stream_frame = tk.Frame(self.controls, bg=self.bg_tertiary)
+        self.stream_frame.pack(pady=5)
+
+        self.stream_label = tk.Label(self.stream_frame, text="Stream Results To:",
+                                     font=self.font_main, bg=self.bg_tertiary,
+                                     fg=self.text_color)
+        self.stream_label.pack(side="left", padx=5)
+
+        self.stream_entry = tk.Entry(self.stream_frame, width=34, font=self.font_main,
+                                     bg=self.entry_bg, fg=self.entry_fg, bd=3)
+        self.stream_entry.insert(0, self.stream_export)
+        self.stream_entry.pack(side="left", padx=5)
+
+        self.stream_browse_btn = tk.Button(self.stream_frame, text="...",
+                                           command=self.browse_stream_export,
+                                           font=self.font_main, bg=self.accent,
+                                           fg=self.btn_fg, bd=3, relief=self.relief_style,
+                                           cursor="hand2")
+        self.stream_browse_btn.pack(side="left", padx=5)
+
+        # Per-cell rows in the streamed export; turns off early exit, hence "slower"
+        self.cell_details_check = tk.Checkbutton(self.stream_frame,
+                                                text="Cell Details (slower)",
+                                                variable=self.cell_details_var,
+                                                bg=self.bg_tertiary, fg=self.text_color,
+                                                font=self.font_main, selectcolor=self.entry_bg,
+                                                activebackground=self.bg_tertiary,
+                                                activeforeground=self.text_color)
+        self.cell_details_check.pack(side="left", padx=5)
+
+        # Query, e.g. A AND (B OR C) AND NOT D, or ROW(A, B) for the same row
+        self.query_frame = tk.Frame(self.controls, bg=self.bg_tertiary)
+        self.query_frame.pack(pady=5)
+
+        self.query_label = tk.Label(self.query_frame, text="Query (optional):",
+                                    font=self.font_main, bg=self.bg_tertiary,
+                                    fg=self.text_color)
+        self.query_label.pack(side="left", padx=5)
+
+        self.query_entry = tk.Entry(self.query_frame, width=40, font=self.font_main,
+                                    bg=self.entry_bg, fg=self.entry_fg, bd=3)
+        self.query_entry.insert(0, self.saved_query)
+        self.query_entry.pack(side="left", padx=5)
+
         # Search Options
         self.options_frame = tk.Frame(self.controls, bg=self.bg_tertiary)
         self.options_frame.pack(pady=10)
@@ -647,6 +821,35 @@ class TDScannerGUI:
                                          activeforeground=self.text_color)
         self.regex_check.pack(side="left", padx=10)
 
+        # Ignore the cached folder listings and walk the whole tree again
+        self.refresh_check = tk.Checkbutton(self.options_frame, text="Rescan Folders",
+                                           variable=self.refresh_discovery_var,
+                                           bg=self.bg_tertiary, fg=self.text_color,
+                                           font=self.font_main, selectcolor=self.entry_bg,
+                                           activebackground=self.bg_tertiary,
+                                           activeforeground=self.text_color)
+        self.refresh_check.pack(side="left", padx=10)
+
+        # Scan at low priority and with capped CPU and disk use
+        self.background_check = tk.Checkbutton(self.options_frame, text="Background Mode",
+                                              variable=self.background_mode_var,
+                                              bg=self.bg_tertiary, fg=self.text_color,
+                                              font=self.font_main, selectcolor=self.entry_bg,
+                                              activebackground=self.bg_tertiary,
+                                              activeforeground=self.text_color)
+        self.background_check.pack(side="left", padx=10)
+
+        self.mode_label = tk.Label(self.options_frame, text="Search In:",
+                                   font=self.font_main, bg=self.bg_tertiary,
+                                   fg=self.text_color)
+        self.mode_label.pack(side="left", padx=(10, 2))
+
+        self.mode_selector = ttk.Combobox(self.options_frame, textvariable=self.scan_mode_var,
+                                          values=list(SCAN_MODE_LABELS.keys()),
+                                          state="readonly", width=18,
+                                          font=self.font_main)
+        self.mode_selector.pack(side="left", padx=2)
+
         # Scan and Cancel Buttons
         self.btn_frame = tk.Frame(self.controls, bg=self.bg_tertiary)
         self.btn_frame.pack(pady=10)
@@ -665,6 +868,15 @@ class TDScannerGUI:
                                     cursor="hand2", width=10, state="disabled")
         self.cancel_btn.pack(side="left", padx=5)
 
+        # Continue an interrupted scan with only the files it had not finished
+        self.resume_btn = tk.Button(self.btn_frame, text="Resume",
+                                    command=lambda: self.start_scan(resume=True),
+                                    font=self.font_main, bg=self.accent,
+                                    fg=self.btn_fg, bd=5, relief=self.relief_style,
+                                    cursor="hand2", width=10)
+        self.resume_btn.pack(side="left", padx=5)
+        self.update_resume_button()
+
         # Progress Bar
         self.progress_frame = tk.Frame(self.controls, bg=self.bg_tertiary)
         self.progress_frame.pack(pady=5, fill="x", padx=20)
@@ -709,6 +921,7 @@ class TDScannerGUI:
         # Store results for export
         self.last_results = []
         self.last_file_count = 0
+        self.last_targets = []
 
         # Status Bar
         self.status_bar = tk.Label(self.root, text=self.status_ready,
@@ -716,70 +929,77 @@ class TDScannerGUI:
                                   fg=self.text_color, bd=3, relief="sunken")
         self.status_bar.pack(fill="x", side="bottom")
 
-    def on_targets_configure(self, event=None):
-        # Update scrollregion when targets container size changes
-        self.targets_canvas.configure(scrollregion=self.targets_canvas.bbox("all"))
-
-    def on_canvas_configure(self, event):
-        # Update the width of the canvas window to match canvas width
-        canvas_width = event.width
-        self.targets_canvas.itemconfig(self.canvas_frame, width=canvas_width)
-
-    def on_mousewheel(self, event):
-        # Enable mousewheel scrolling
-        self.targets_canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-
-    def add_target_field(self, default_value=""):
-        # Create a frame for this target entry
-        entry_frame = tk.Frame(self.targets_container, bg=self.bg_tertiary)
-        entry_frame.pack(fill="x", pady=3)
-
-        # Target number label
-        target_num = len(self.target_entries) + 1
-        num_label = tk.Label(entry_frame, text=f"#{target_num}:",
-                            font=self.font_main, bg=self.bg_tertiary,
-                            fg=self.text_color, width=3)
-        num_label.pack(side="left", padx=2)
-
-        # Entry field
-        entry = tk.Entry(entry_frame, width=40, font=self.font_main,
-                        bg=self.entry_bg, fg=self.entry_fg, bd=3)
-        if default_value:
-            entry.insert(0, default_value)
-        entry.pack(side="left", padx=5)
-
-        # Remove button
-        remove_btn = tk.Button(entry_frame, text="✖",
-                              command=lambda: self.remove_target_field(entry_frame, entry),
-                              font=self.font_main, bg="#FF6347",
-                              fg="white", bd=2, relief=self.relief_style,
-                              cursor="hand2", width=3)
-        remove_btn.pack(side="left", padx=2)
-
-        # Store reference
-        self.target_entries.append(entry)
-
-        # Update scroll region
-        self.targets_container.update_idletasks()
-        self.targets_canvas.configure(scrollregion=self.targets_canvas.bbox("all"))
-
-    def remove_target_field(self, frame, entry):
-        if len(self.target_entries) <= 1:
-            messagebox.showwarning("Warning", "You need at least one search target!")
+    def add_targets(self, targets):
+        """Append targets to the list, skipping ones already present"""
+        seen = set(self.targets)
+        new_targets = []
+        for target in targets:
+            if target not in seen:
+                seen.add(target)
+                new_targets.append(target)
+
+        if new_targets:
+            self.targets.extend(new_targets)
+            self.target_listbox.insert(tk.END, *new_targets)
+        self.update_target_count()
+        return len(new_targets)
+
+    def add_target_from_entry(self):
+        target = self.target_entry.get().strip()
+        if target:
+            self.add_targets([target])
+            self.target_entry.delete(0, tk.END)
+            self.target_listbox.see(tk.END)
+
+    def import_targets(self):
+        """Import targets from a text or CSV file"""
+        file_path = filedialog.askopenfilename(
+            filetypes=[("Target lists", "*.txt *.csv"), ("All files", "*.*")]
+        )
+        if not file_path:
             return
 
-        self.target_entries.remove(entry)
-        frame.destroy()
-        self.update_target_numbers()
+        try:
+            targets = read_target_file(file_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to import:\n{str(e)}")
+            return
+
+        added = self.add_targets(targets)
+        self.update_status(f"Imported {added} new target(s) from {os.path.basename(file_path)}")
+
+    def remove_selected_targets(self):
+        selected = set(self.target_listbox.curselection())
+        if not selected:
+            return
+
+        self.targets = [t for i, t in enumerate(self.targets) if i not in selected]
+        for index in sorted(selected, reverse=True):
+            self.target_listbox.delete(index)
+        self.update_target_count()
+
+    def edit_selected_target(self):
+        # Move the double-clicked target back into the entry for editing
+        selected = self.target_listbox.curselection()
+        if not selected:
+            return
 
-    def update_target_numbers(self):
-        # Update the numbering after removal
-        for i, entry in enumerate(self.target_entries, 1):
-            parent = entry.master
-            for widget in parent.winfo_children():
-                if isinstance(widget, tk.Label) and widget.cget("text").startswith("#"):
-                    widget.config(text=f"#{i}:")
-                    break
+        index = selected[0]
+        target = self.targets.pop(index)
+        self.target_listbox.delete(index)
+        self.target_entry.delete(0, tk.END)
+        self.target_entry.insert(0, target)
+        self.target_entry.focus_set()
+        self.update_target_count()
+
+    def clear_targets(self):
+        if self.targets and messagebox.askyesno("Confirm", f"Remove all {len(self.targets)} targets?"):
+            self.targets = []
+            self.target_listbox.delete(0, tk.END)
+            self.update_target_count()
+
+    def update_target_count(self):
+        self.target_count_label.config(text=f"{len(self.targets)} target(s)")
 
     def browse_directory(self):
         directory = filedialog.askdirectory()
@@ -787,15 +1007,37 @@ class TDScannerGUI:
             self.dir_entry.delete(0, tk.END)
             self.dir_entry.insert(0, directory)
 
-    def start_scan(self):
+    def browse_stream_export(self):
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("CSV files", "*.csv"),
+                       ("Excel files", "*.xlsx")],
+            initialfile="scan_results.jsonl"
+        )
+        if file_path:
+            self.stream_entry.delete(0, tk.END)
+            self.stream_entry.insert(0, file_path)
+
+    def update_resume_button(self):
+        """Offer Resume only while an unfinished scan's checkpoint exists"""
+        resumable = self.checkpoint and self.checkpoint_file.exists()
+        self.resume_btn.config(state="normal" if resumable else "disabled")
+
+    def start_scan(self, resume=False):
         root_dir = self.dir_entry.get().strip()
 
-        # Collect all target values from entry fields
-        targets = []
-        for entry in self.target_entries:
-            target = entry.get().strip()
-            if target:
-                targets.append(target)
+        # Pick up a target typed but not yet added
+        self.add_target_from_entry()
+        targets = list(self.targets)
+
+        # A query searches for its own terms instead of the target list
+        query = self.query_entry.get().strip()
+        if query:
+            try:
+                targets = QueryPlan(query).terms
+            except QueryError as e:
+                messagebox.showerror("Error!", f"Invalid query:\n{str(e)}")
+                return
 
         if not targets:
             messagebox.showerror("Error!", "Please enter at least one search target!")
@@ -805,118 +1047,147 @@ class TDScannerGUI:
             messagebox.showerror("Error!", "Directory does not exist!")
             return
 
+        stream_export = self.stream_entry.get().strip()
+        if stream_export and os.path.splitext(stream_export)[1].lower() not in SINKS:
+            messagebox.showerror("Error!", "Results can only be streamed to .jsonl, .csv or .xlsx files!")
+            return
+
         # Get search options
         case_sensitive = self.case_sensitive_var.get()
         use_regex = self.use_regex_var.get()
+        mode = SCAN_MODE_LABELS[self.scan_mode_var.get()]
+        refresh_discovery = self.refresh_discovery_var.get()
+        background = self.background_mode_var.get()
+        # Cell-level hits only go to the streamed export
+        cell_details = bool(stream_export) and self.cell_details_var.get()
 
-        # Reset cancellation flag
-        self.scan_cancelled = False
+        # Fresh cancellation token for this scan
+        self.scan_token = CancelToken()
 
         # Update UI
         self.results_text.delete(1.0, tk.END)
         self.status_bar.config(text=self.status_scanning, bg=self.accent)
         self.progress_bar["value"] = 0
         self.scan_btn.config(state="disabled")
+        self.resume_btn.config(state="disabled")
         self.cancel_btn.config(state="normal")
 
         # Run scan in separate thread
         thread = threading.Thread(target=self.perform_scan,
-                                 args=(targets, root_dir, case_sensitive, use_regex))
+                                 args=(targets, root_dir, case_sensitive, use_regex, mode,
+                                       refresh_discovery, stream_export, query, resume,
+                                       background, cell_details))
         thread.daemon = True
         thread.start()
 
     def cancel_scan(self):
         """Cancel the ongoing scan"""
-        self.scan_cancelled = True
-        if self.executor:
-            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.scan_token:
+            self.scan_token.cancel()
         self.update_status("Scan cancelled by user", self.bg_secondary)
         self.scan_btn.config(state="normal")
         self.cancel_btn.config(state="disabled")
 
-    def perform_scan(self, targets, root_dir, case_sensitive=False, use_regex=False):
-        targets_set = set(targets)
+    def perform_scan(self, targets, root_dir, case_sensitive=False, use_regex=False,
+                     mode="values", refresh_discovery=False, stream_export="", query="",
+                     resume=False, background=False, cell_details=False):
+        token = self.scan_token
+        options = ScanOptions(case_sensitive=case_sensitive, use_regex=use_regex, mode=mode,
+                              max_workers=self.max_workers,
+                              read_ahead_threads=self.read_ahead_threads,
+                              read_ahead_mb=self.read_ahead_mb,
+                              memory_budget_mb=self.memory_budget_mb,
+                              backend=self.executor_backend,
+                              scan_archives=self.scan_archives,
+                              discovery_cache=(str(self.discovery_cache_file)
+                                               if self.discovery_cache else None),
+                              refresh_discovery=refresh_discovery,
+                              split_threshold_mb=self.split_threshold_mb,
+                              cell_details=cell_details,
+                              query=query or None,
+                              checkpoint=str(self.checkpoint_file) if self.checkpoint else None,
+                              resume=resume,
+                              background=background,
+                              cpu_limit_percent=self.cpu_limit_percent,
+                              read_limit_mb=self.read_limit_mb)
         results = []
+        memory_stats = []  # heap of the top (peak, file_path, estimate)
+        file_count = 0
+        sink = None
 
-        try:
-            # First, collect all Excel file paths
-            file_paths = []
-            for dirpath, dirnames, filenames in os.walk(root_dir):
-                for file in filenames:
-                    if "TD" in file and file.endswith(".xlsx") and not file.startswith("~$"):
-                        file_paths.append(os.path.join(dirpath, file))
-
-            file_count = len(file_paths)
-            self.update_status(f"Found {file_count} files to scan...")
-
-            if file_count == 0:
-                self.display_results([], 0)
-                self.scan_btn.config(state="normal")
-                self.cancel_btn.config(state="disabled")
-                return
+        def on_progress(progress):
+            # Runs on this thread between results, so also the streamed export's flush timer
+            if sink is not None:
+                sink.tick()
+            self.show_progress(progress)
 
-            # Use multiprocessing to scan files in parallel
-            # Use max 4 processes to avoid overwhelming the system
-            max_workers = min(4, multiprocessing.cpu_count())
-            processed = 0
-
-            with ProcessPoolExecutor(max_workers=max_workers) as executor:
-                self.executor = executor
-
-                # Submit all tasks
-                future_to_file = {
-                    executor.submit(scan_single_file, fp, targets_set,
-                                  case_sensitive, use_regex): fp
-                    for fp in file_paths
-                }
-
-                # Process completed tasks
-                for future in as_completed(future_to_file):
-                    # Check if scan was cancelled
-                    if self.scan_cancelled:
-                        break
-
-                    processed += 1
-                    file_path = future_to_file[future]
-                    file_name = os.path.basename(file_path)
-
-                    # Update progress
-                    progress = (processed / file_count) * 100
-                    self.root.after(0, lambda p=progress: self.progress_bar.config(value=p))
-                    self.update_status(f"Progress: {processed}/{file_count} - {file_name}")
-
-                    try:
-                        result = future.result()
-                        if result:
-                            if "error" in result:
-                                self.append_result(f"❌ Error: {result['file']}\n   {result['error']}\n\n")
-                            else:
-                                results.append(result)
-                    except Exception as e:
-                        self.append_result(f"❌ Error: {file_path}\n   {str(e)}\n\n")
-
-            self.executor = None
+        try:
+            if stream_export:
+                sink = open_sink(stream_export)
+            for result in scan(root_dir, targets, options, cancel=token,
+                               progress=on_progress, pool=self.worker_pool):
+                file_count += 1
+                if result.peak_memory:
+                    entry = (result.peak_memory, result.file, result.estimated_memory)
+                    if len(memory_stats) < MEMORY_SUMMARY_LIMIT:
+                        heapq.heappush(memory_stats, entry)
+                    else:
+                        heapq.heappushpop(memory_stats, entry)
+                if sink is not None:
+                    sink.write(result)
+                    result.cells = []
+                if result.error:
+                    self.append_result(f"❌ Error: {result.file}\n   {result.error}\n\n")
+                elif result.query_match if query else result.found:
+                    results.append(result)
 
             # Display results if not cancelled
-            if not self.scan_cancelled:
-                self.display_results(results, file_count)
+            if not token.cancelled:
+                self.display_results(results, file_count, targets, memory_stats)
 
             # Re-enable scan button
             self.scan_btn.config(state="normal")
             self.cancel_btn.config(state="disabled")
 
+        except CheckpointError as e:
+            self.append_result(f"\n❌ Cannot resume: {str(e)}\n")
+            self.update_status("Resume failed - start a new scan", self.accent)
+            self.scan_btn.config(state="normal")
+            self.cancel_btn.config(state="disabled")
+
         except Exception as e:
             self.append_result(f"\n❌ CRITICAL ERROR: {str(e)}\n")
             self.update_status("Scan failed!", self.accent)
             self.scan_btn.config(state="normal")
             self.cancel_btn.config(state="disabled")
 
-    def display_results(self, results, file_count):
+        finally:
+            self.update_resume_button()
+            # Also on cancel or failure, so everything received so far is kept
+            if sink is not None:
+                try:
+                    sink.close()
+                except Exception as e:
+                    self.append_result(f"\n❌ Failed to write {stream_export}: {str(e)}\n")
+
+    def show_progress(self, progress):
+        # Called on the scan thread; widgets are only touched through root.after
+        if progress.done_files == 0:
+            self.update_status(f"Found {progress.total_files} files to scan "
+                               f"({progress.total_bytes / (1024 * 1024):.1f} MB, "
+                               f"{progress.backend} workers)...")
+            return
+        value = progress.fraction * 100
+        self.root.after(0, lambda: self.progress_bar.config(value=value))
+        self.update_status(f"Progress: {progress.describe()}")
+
+    def display_results(self, results, file_count, targets, memory_stats=()):
         self.results_text.delete(1.0, tk.END)
 
         # Store results for export
         self.last_results = results
         self.last_file_count = file_count
+        self.last_targets = targets
 
         # Enable export buttons if there are results
         if results:
@@ -926,31 +1197,21 @@ class TDScannerGUI:
             self.export_txt_btn.config(state="disabled")
             self.export_csv_btn.config(state="disabled")
 
-        # Count total matches per target
-        target_counts = {}
-        for r in results:
-            for target in r['found']:
-                target_counts[target] = target_counts.get(target, 0) + 1
-
         header = f"{'='*60}\n"
         header += f"★ SCAN COMPLETE ★\n"
         header += f"{'='*60}\n\n"
         header += f"Files scanned: {file_count}\n"
-        header += f"Files with matches: {len(results)}\n"
-
-        if target_counts:
-            header += f"\nMatches by target:\n"
-            for target, count in sorted(target_counts.items()):
-                header += f"  • {target}: {count} file(s)\n"
-
+        header += f"Files with matches: {len(results)}\n\n"
+        header += format_target_summary(results, targets)
+        header += format_memory_summary(memory_stats)
         header += f"\n{'='*60}\n\n"
 
         self.append_result(header)
 
         if results:
             for i, r in enumerate(results, 1):
-                result_text = f"#{i} 📄 {r['file']}\n"
-                result_text += f"   ➤ Found: {', '.join(sorted(r['found']))}\n\n"
+                result_text = f"#{i} 📄 {r.file}\n"
+                result_text += f"   ➤ Found: {format_found(r)}\n\n"
                 self.append_result(result_text)
 
             self.update_status(f"Scan complete! Found {len(results)} files with matches", self.bg_secondary)
@@ -990,24 +1251,14 @@ class TDScannerGUI:
                 f.write("="*60 + "\n\n")
                 f.write(f"Files scanned: {self.last_file_count}\n")
                 f.write(f"Files with matches: {len(self.last_results)}\n\n")
-
-                # Count matches by target
-                target_counts = {}
-                for r in self.last_results:
-                    for target in r['found']:
-                        target_counts[target] = target_counts.get(target, 0) + 1
-
-                if target_counts:
-                    f.write("Matches by target:\n")
-                    for target, count in sorted(target_counts.items()):
-                        f.write(f"  • {target}: {count} file(s)\n")
+                f.write(format_target_summary(self.last_results, self.last_targets))
 
                 f.write("\n" + "="*60 + "\n\n")
 
                 # Write detailed results
                 for i, r in enumerate(self.last_results, 1):
-                    f.write(f"#{i} {r['file']}\n")
-                    f.write(f"   Found: {', '.join(sorted(r['found']))}\n\n")
+                    f.write(f"#{i} {r.file}\n")
+                    f.write(f"   Found: {format_found(r)}\n\n")
 
             messagebox.showinfo("Success", f"Results exported to:\n{file_path}")
         except Exception as e:
@@ -1033,12 +1284,14 @@ class TDScannerGUI:
             with open(file_path, 'w', encoding='utf-8-sig', newline='') as f:
                 writer = csv.writer(f)
                 # Write header
-                writer.writerow(["#", "File Path", "Found Targets", "Target Count"])
+                writer.writerow(["#", "File Path", "Found Targets", "Target Count", "Found In Formulas"])
 
                 # Write data
                 for i, r in enumerate(self.last_results, 1):
-                    targets_str = ", ".join(sorted(r['found']))
-                    writer.writerow([i, r['file'], targets_str, len(r['found'])])
+                    targets_str = ", ".join(sorted(r.found))
+                    in_formulas = ", ".join(sorted(t for t, where in r.matched_in.items()
+                                                   if "formula" in where))
+                    writer.writerow([i, r.file, targets_str, len(r.found), in_formulas])
 
             messagebox.showinfo("Success", f"Results exported to:\n{file_path}")
         except Exception as e:
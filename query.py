@@ -0,0 +1,223 @@
+"""Boolean queries over search targets
+
+    deepTarget AND (formulaTarget OR "sheet 1") AND NOT legacy
+    ROW(orgEmpCertDetail, "Y")
+
+Terms are bare words or "double-quoted strings" (backslash escapes a quote).
+NOT binds tighter than AND, and AND tighter than OR. ROW(a, b, ...) holds
+when a single row contains every listed term. Operators are
+case-insensitive; quote a term that is spelled like one.
+
+A query is compiled once into a QueryPlan. While a file streams, a
+QueryEvaluation collects facts (terms seen anywhere, ROW groups seen
+together) and evaluates the plan in three-valued logic, with unseen facts
+unknown. The file can be abandoned as soon as the result is no longer
+unknown, e.g. when a term under NOT shows up.
+"""
+import re
+
+class QueryError(ValueError):
+    """Raised for a query that cannot be parsed"""
+
+OPERATORS = ("AND", "OR", "NOT")
+
+TOKEN = re.compile(r'\s*(?:([(),])|"((?:[^"\\]|\\.)*)"|([^\s(),"]+))')
+# The bracket that makes a preceding ROW the operator rather than a term
+ROW_BRACKET = re.compile(r'\s*\(')
+
+def tokenize(text):
+    """Split a query into (kind, value) tokens; kind is an operator, a bracket, "," or "term" """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise QueryError(f"Unterminated quote at position {position + 1}")
+        punctuation, quoted, word = match.groups()
+        if punctuation:
+            tokens.append((punctuation, punctuation))
+        elif quoted is not None:
+            if not quoted:
+                # Would match every text cell
+                raise QueryError(f"Empty quoted term at position {match.start(2)}")
+            tokens.append(("term", re.sub(r'\\(.)', r'\1', quoted)))
+        elif word.upper() in OPERATORS:
+            tokens.append((word.upper(), word))
+        elif word.upper() == "ROW" and ROW_BRACKET.match(text, match.end()):
+            tokens.append(("ROW", word))
+        else:
+            tokens.append(("term", word))
+        position = match.end()
+    return tokens
+
+class QueryPlan:
+    """A compiled query: its terms, ROW groups and expression tree
+
+    Facts are numbered: terms first (in order of appearance), then ROW
+    groups. Tree nodes are ("fact", index), ("not", node) and
+    ("and" | "or", [nodes]).
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.terms = []
+        self.rows = []  # term indices of each ROW(...)
+        self._tokens = tokenize(text)
+        self._position = 0
+        if not self._tokens:
+            raise QueryError("Empty query")
+        tree = self._parse_or()
+        if self._position < len(self._tokens):
+            raise QueryError(f"Unexpected {self._tokens[self._position][1]!r}")
+        del self._tokens
+
+        # ROW groups were numbered as they were parsed; move them after the terms
+        term_count = len(self.terms)
+        self.tree = self._renumber(tree, term_count)
+        self.fact_count = term_count + len(self.rows)
+        self._term_index = {t: i for i, t in enumerate(self.terms)}
+
+    # Recursive descent: or_expr := and_expr (OR and_expr)*, and so on
+
+    def _peek(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position][0]
+        return None
+
+    def _take(self, kind):
+        if self._peek() != kind:
+            found = self._tokens[self._position][1] if self._peek() else "end of query"
+            raise QueryError(f"Expected {kind!r} but found {found!r}")
+        value = self._tokens[self._position][1]
+        self._position += 1
+        return value
+
+    def _parse_or(self):
+        children = [self._parse_and()]
+        while self._peek() == "OR":
+            self._take("OR")
+            children.append(self._parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def _parse_and(self):
+        children = [self._parse_not()]
+        while self._peek() == "AND":
+            self._take("AND")
+            children.append(self._parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def _parse_not(self):
+        if self._peek() == "NOT":
+            self._take("NOT")
+            return ("not", self._parse_not())
+        return self._parse_atom()
+
+    def _parse_atom(self):
+        kind = self._peek()
+        if kind == "(":
+            self._take("(")
+            node = self._parse_or()
+            self._take(")")
+            return node
+        if kind == "ROW":
+            self._take("ROW")
+            self._take("(")
+            group = [self._term(self._take("term"))]
+            while self._peek() == ",":
+                self._take(",")
+                group.append(self._term(self._take("term")))
+            self._take(")")
+            self.rows.append(tuple(group))
+            return ("row", len(self.rows) - 1)
+        return ("fact", self._term(self._take("term")))
+
+    def _term(self, text):
+        if text not in self.terms:
+            self.terms.append(text)
+        return self.terms.index(text)
+
+    def _renumber(self, node, term_count):
+        kind = node[0]
+        if kind == "row":
+            return ("fact", term_count + node[1])
+        if kind == "fact":
+            return node
+        if kind == "not":
+            return ("not", self._renumber(node[1], term_count))
+        return (kind, [self._renumber(child, term_count) for child in node[1]])
+
+    def facts_in_row(self, row_hits):
+        """Fact indices for a set of terms found in one row (the terms and any ROW groups)"""
+        facts = {self._term_index[t] for t in row_hits if t in self._term_index}
+        for i, group in enumerate(self.rows):
+            if all(t in facts for t in group):
+                facts.add(len(self.terms) + i)
+        return facts
+
+    def evaluate(self, facts, complete=False):
+        """True, False or None (undecided) given the facts seen so far
+
+        Until complete, a fact not seen yet is unknown rather than false.
+        """
+        return self._evaluate(self.tree, facts, complete)
+
+    def _evaluate(self, node, facts, complete):
+        kind = node[0]
+        if kind == "fact":
+            if node[1] in facts:
+                return True
+            return False if complete else None
+        if kind == "not":
+            value = self._evaluate(node[1], facts, complete)
+            return None if value is None else not value
+
+        # Kleene AND/OR: a deciding child settles it, otherwise any unknown stays unknown
+        deciding = kind == "or"
+        result = not deciding
+        for child in node[1]:
+            value = self._evaluate(child, facts, complete)
+            if value is deciding:
+                return deciding
+            if value is None:
+                result = None
+        return result
+
+    def evaluation(self):
+        return QueryEvaluation(self)
+
+class QueryEvaluation:
+    """Facts seen so far in one file, and whether the query is already decided"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.facts = set()
+        self.value = plan.evaluate(self.facts)
+
+    @property
+    def decided(self):
+        return self.value is not None
+
+    def add_row(self, row_hits):
+        """Record the terms found in one row; returns whether the query is now decided"""
+        new_facts = self.plan.facts_in_row(row_hits) - self.facts
+        if new_facts:
+            self.facts |= new_facts
+            self.value = self.plan.evaluate(self.facts)
+        return self.value is not None
+
+    def result(self):
+        """Final answer once the file has been read (or abandoned because it was decided)"""
+        if self.value is not None:
+            return self.value
+        return self.plan.evaluate(self.facts, complete=True)
+
+_plan_cache = {}
+
+def get_query(text):
+    """Compile a query once per worker process"""
+    plan = _plan_cache.get(text)
+    if plan is None:
+        _plan_cache.clear()
+        plan = _plan_cache[text] = QueryPlan(text)
+    return plan
@@ -0,0 +1,2231 @@
+"""TD workbook scanning engine, usable without the GUI
+
+    from scanner import scan, ScanOptions
+
+    if __name__ == "__main__":
+        for result in scan(r"D:\\Specs", ["orgEmpCertDetail"], ScanOptions(case_sensitive=True)):
+            if result.found:
+                print(result.file, result.found)
+
+Worker processes are started with "spawn" on every platform, so like any
+multiprocessing program the calling script must guard its entry point.
+"""
+import os
+import threading
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque, OrderedDict
+from dataclasses import dataclass, field, asdict
+import datetime
+import hashlib
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+import io
+import json
+import platform
+import queue
+import time
+import re
+import sys
+import zipfile
+from array import array
+from itertools import accumulate
+from contextlib import contextmanager
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+from xlsx_stream import (read_shared_strings, read_date_styles, sheet_parts, iter_sheet_rows,
+                         iter_metadata)
+from query import get_query
+
+class SharedBufferReader(io.RawIOBase):
+    """Read-only, seekable file object over a shared memory block"""
+
+    def __init__(self, buf, size):
+        super().__init__()
+        self._view = buf[:size]
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def readinto(self, b):
+        n = max(0, min(len(b), self._size - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        # The view must be released before the shared memory can be closed
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+class ReadAhead:
+    """Fetch file contents on I/O threads ahead of the parse workers
+
+    Each file is read into a shared memory block, so network latency overlaps
+    with parsing and the workers get the bytes without a pickled copy. The
+    parse memory estimate is taken from the buffered zip directory while the
+    bytes are at hand.
+    At most budget_bytes are held at once; a file larger than the budget is
+    only fetched when nothing else is held. With a RateLimiter, files are
+    read in READ_LIMIT_CHUNK pieces paced to its rate, and background runs
+    the I/O threads at low priority.
+    """
+
+    def __init__(self, file_paths, max_threads=4, budget_bytes=256 * 1024 * 1024, sizes=None,
+                 limiter=None, background=False):
+        self._pending = deque(file_paths)
+        self._limiter = limiter
+        self._background = background
+        # Discovery sizes, needed for archive members which cannot be stat'ed
+        self._sizes = sizes or {}
+        self._ready = queue.Queue()
+        self._held = {}
+        self._budget = budget_bytes
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._fetch_loop, daemon=True)
+                         for _ in range(max(1, max_threads))]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def _fetch_loop(self):
+        if self._background:
+            lower_priority(thread_only=True)
+        # Unpaced reads fetch the whole file at once
+        chunk = READ_LIMIT_CHUNK if self._limiter is not None else None
+        while True:
+            with self._cond:
+                if self._closed or not self._pending:
+                    return
+                file_path = self._pending.popleft()
+
+            try:
+                if is_archive_member(file_path):
+                    size = self._sizes[file_path]
+                else:
+                    size = os.path.getsize(file_path)
+            except (OSError, KeyError):
+                # Let the parse worker open the path and report the error
+                self._ready.put((file_path, None, WORKER_BASE_MEMORY))
+                continue
+
+            with self._cond:
+                while not self._closed and self._in_use and self._in_use + size > self._budget:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._in_use += size
+
+            shm = None
+            try:
+                shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+                with open_source(file_path) as f, shm.buf[:size] as view:
+                    offset = 0
+                    while offset < size and not self._closed:
+                        n = f.readinto(view[offset:offset + chunk] if chunk else view[offset:])
+                        if not n:
+                            break
+                        offset += n
+                        if self._limiter is not None:
+                            time.sleep(self._limiter.consume(n))
+                if offset < size:
+                    raise OSError("file shrank while reading")
+            except SOURCE_ERRORS:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+                with self._cond:
+                    self._in_use -= size
+                    self._cond.notify_all()
+                self._ready.put((file_path, None, estimate_parse_memory(file_path)))
+                continue
+
+            reader = SharedBufferReader(shm.buf, size)
+            try:
+                estimate = estimate_parse_memory(reader)
+            finally:
+                reader.close()
+
+            with self._cond:
+                if self._closed:
+                    shm.close()
+                    shm.unlink()
+                    return
+                self._held[shm.name] = (shm, size)
+            self._ready.put((file_path, (shm.name, size), estimate))
+
+    def ready(self, timeout=0):
+        """Return (file_path, buffer, estimate) items fetched so far; buffer is None on read failure"""
+        items = []
+        try:
+            items.append(self._ready.get(timeout=timeout) if timeout else self._ready.get_nowait())
+            while True:
+                items.append(self._ready.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def release(self, buffer):
+        """Free a buffer once its parse has finished"""
+        with self._cond:
+            entry = self._held.pop(buffer[0], None)
+            if entry is None:
+                return
+            self._in_use -= entry[1]
+            self._cond.notify_all()
+        entry[0].close()
+        entry[0].unlink()
+
+    def close(self):
+        """Stop fetching and free every buffer still held"""
+        with self._cond:
+            self._closed = True
+            held = list(self._held.values())
+            self._held.clear()
+            self._in_use = 0
+            self._cond.notify_all()
+        for shm, _ in held:
+            shm.close()
+            shm.unlink()
+
+# Minimum seconds between progress callbacks
+PROGRESS_INTERVAL = 0.25
+
+def is_td_workbook(file_name):
+    """Whether a file name looks like a TD workbook (Excel lock files excluded)"""
+    return "TD" in file_name and file_name.endswith(".xlsx") and not file_name.startswith("~$")
+
+# Workbooks inside .zip archives are addressed as "bundle.zip!/dir/TD_x.xlsx",
+# with one separator per level of nesting
+ARCHIVE_SEPARATOR = "!/"
+ARCHIVE_SPLIT = re.compile(r"(?<=\.zip)!/", re.IGNORECASE)
+MAX_ARCHIVE_DEPTH = 4
+# Compression methods zipfile can read; members using others are skipped
+ARCHIVE_COMPRESSIONS = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2,
+                        zipfile.ZIP_LZMA)
+
+# Raised when reading a workbook or archive member fails: zipfile raises
+# RuntimeError for encrypted members and NotImplementedError for
+# unsupported compression
+SOURCE_ERRORS = (OSError, KeyError, zipfile.BadZipFile, RuntimeError, NotImplementedError)
+
+def is_archive(file_name):
+    return file_name.lower().endswith(".zip")
+
+def split_archive_path(file_path):
+    """Split "a.zip!/b.zip!/TD_x.xlsx" into ["a.zip", "b.zip", "TD_x.xlsx"]"""
+    return ARCHIVE_SPLIT.split(file_path)
+
+def is_archive_member(file_path):
+    return ARCHIVE_SEPARATOR in file_path and len(split_archive_path(file_path)) > 1
+
+# Bytes of nested archives kept in memory per process (see NestedArchiveCache)
+NESTED_ARCHIVE_CACHE_BYTES = 256 * 1024 * 1024
+
+class NestedArchiveCache:
+    """Nested archives loaded into memory once and shared by all their members
+
+    A nested zip is read whole, since seeking inside a compressed member is
+    slow. Without the cache every workbook of a bundle would load and
+    decompress the whole bundle again, for its read-ahead, its memory
+    estimate and its parse. Archives are kept, most recently used first,
+    while they fit the byte budget, and dropped when the outer file changes.
+    """
+
+    def __init__(self, budget_bytes):
+        self._budget = budget_bytes
+        self._size = 0
+        self._entries = OrderedDict()  # (chain, mtime_ns, size) -> (ZipFile, nbytes)
+        self._lock = threading.Lock()
+
+    def get(self, chain):
+        """ZipFile over the innermost archive of ["outer.zip", "nested.zip", ...]"""
+        stat = os.stat(chain[0])
+        key = (tuple(chain), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        # Loaded outside the lock; two threads may occasionally both load one
+        if len(chain) == 2:
+            with zipfile.ZipFile(chain[0]) as outer:
+                data = outer.read(chain[1])
+        else:
+            data = self.get(chain[:-1]).read(chain[-1])
+        zf = zipfile.ZipFile(io.BytesIO(data))
+
+        with self._lock:
+            if len(data) <= self._budget and key not in self._entries:
+                self._entries[key] = (zf, len(data))
+                self._size += len(data)
+                # Evicted archives stay readable by whoever still holds them
+                while self._size > self._budget:
+                    _, (_, nbytes) = self._entries.popitem(last=False)
+                    self._size -= nbytes
+        return zf
+
+_nested_archives = NestedArchiveCache(NESTED_ARCHIVE_CACHE_BYTES)
+
+@contextmanager
+def open_source(file_path):
+    """Open a workbook for binary reading, whether a plain file or a member of (nested) zip archives"""
+    parts = split_archive_path(file_path)
+    if len(parts) == 1:
+        with open(file_path, 'rb') as f:
+            yield f
+        return
+
+    if len(parts) == 2:
+        with zipfile.ZipFile(parts[0]) as zf, zf.open(parts[1]) as f:
+            yield f
+        return
+
+    with _nested_archives.get(parts[:-1]).open(parts[-1]) as f:
+        yield f
+
+def read_source(file_path):
+    """Seekable in-memory copy of an archive member, for readers that need random access"""
+    with open_source(file_path) as f:
+        return io.BytesIO(f.read())
+
+def readable_member(info):
+    """Whether zipfile can extract an archive member: not encrypted, with a supported compression"""
+    return not info.flag_bits & 0x1 and info.compress_type in ARCHIVE_COMPRESSIONS
+
+def list_archive(zf, archive_path, depth=1):
+    """Collect (member_path, size) for the TD workbooks in an archive and the archives nested in it
+
+    Encrypted members, and members compressed in a way zipfile cannot read,
+    are left out.
+    """
+    found = []
+    for info in zf.infolist():
+        if info.is_dir() or not readable_member(info):
+            continue
+        name = info.filename.replace("\\", "/").rsplit("/", 1)[-1]
+        member_path = archive_path + ARCHIVE_SEPARATOR + info.filename
+        if is_td_workbook(name):
+            found.append((member_path, info.file_size))
+        elif is_archive(name) and depth < MAX_ARCHIVE_DEPTH:
+            try:
+                with zipfile.ZipFile(io.BytesIO(zf.read(info))) as nested:
+                    found.extend(list_archive(nested, member_path, depth + 1))
+            except SOURCE_ERRORS:
+                # Unreadable archive
+                continue
+    return found
+
+# Listings of directories changed this recently are not trusted, since a
+# coarse (network share) mtime may not move again for a change in the same tick
+DISCOVERY_CACHE_SLACK_NS = 2 * 10**9
+
+class DiscoveryCache:
+    """Directory listings kept between scans and reused while the directory mtime is unchanged
+
+    Each directory maps to its mtime, subdirectory names, TD workbooks with
+    sizes and .zip archives with their own mtime, size and member list. A
+    directory's mtime only moves when entries are added, removed or renamed,
+    so workbook sizes may be stale after an in-place save; they only weight
+    progress and scheduling. Archives are re-listed whenever they change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._dirs = {}
+        self._visited = set()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._dirs = json.load(f)
+        except (OSError, ValueError):
+            # Missing or corrupt cache: start from scratch
+            pass
+
+    def get(self, dirpath, mtime_ns):
+        """Cached listing of dirpath, or None if it changed since it was cached"""
+        # Keyed by absolute path so relative roots from other working directories don't collide
+        dirpath = os.path.abspath(dirpath)
+        self._visited.add(dirpath)
+        entry = self._dirs.get(dirpath)
+        if entry is None or entry["mtime"] != mtime_ns or \
+                entry["listed"] - mtime_ns < DISCOVERY_CACHE_SLACK_NS:
+            return None
+        return entry
+
+    def previous(self, dirpath):
+        """Last listing of dirpath, even if outdated"""
+        return self._dirs.get(os.path.abspath(dirpath))
+
+    def put(self, dirpath, mtime_ns, listed_ns, entry):
+        dirpath = os.path.abspath(dirpath)
+        self._visited.add(dirpath)
+        entry.update(mtime=mtime_ns, listed=listed_ns)
+        self._dirs[dirpath] = entry
+
+    def save(self, root_dir):
+        """Write the cache, dropping directories under root_dir that no longer exist"""
+        root_dir = os.path.abspath(root_dir)
+        prefix = os.path.join(root_dir, "")
+        self._dirs = {d: entry for d, entry in self._dirs.items()
+                      if d in self._visited or not (d == root_dir or d.startswith(prefix))}
+        # Write to a temporary file first so an interrupted save keeps the old cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._dirs, f)
+        os.replace(tmp_path, self.path)
+
+def list_directory(dirpath, previous=None):
+    """List one directory as a cache entry of subdirectories, workbooks and archive records"""
+    # Archive records are [name, mtime_ns, size, members]; members are filled in
+    # lazily and carried over from the previous listing until the archive changes
+    previous_archives = {record[0]: record for record in previous["archives"]} if previous else {}
+    subdirs, workbooks, archives = [], [], []
+    for entry in os.scandir(dirpath):
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif is_td_workbook(entry.name):
+                workbooks.append((entry.name, entry.stat().st_size))
+            elif is_archive(entry.name):
+                archives.append(previous_archives.get(entry.name) or [entry.name, None, None, None])
+        except OSError:
+            continue
+    return {"dirs": subdirs, "workbooks": workbooks, "archives": archives}
+
+def archive_members(archive_path, record):
+    """(member_suffix, size) for the workbooks in an archive, re-listed only when it changed"""
+    try:
+        stat = os.stat(archive_path)
+    except OSError:
+        return []
+    if record[3] is not None and record[1:3] == [stat.st_mtime_ns, stat.st_size]:
+        return record[3]
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            members = [(m[len(archive_path):], size) for m, size in list_archive(zf, archive_path)]
+    except SOURCE_ERRORS:
+        # Remembered as empty so a broken archive is not retried until it changes
+        members = []
+    record[1:] = [stat.st_mtime_ns, stat.st_size, members]
+    return members
+
+def discover_files(root_dir, archives=True, cache=None, refresh=False):
+    """Collect (path, size) for every TD workbook under root_dir
+
+    Sizes come from the directory listing, which is free on Windows and
+    costs one stat per file elsewhere. With archives, workbooks inside .zip
+    files (nested ones included) are listed too, sized by their
+    uncompressed length. With a DiscoveryCache, a directory whose mtime is
+    unchanged costs one stat instead of a listing; refresh lists every
+    directory again and rewrites the cache.
+    """
+    found = []
+    pending = [root_dir]
+    while pending:
+        dirpath = pending.pop()
+        try:
+            if cache is None:
+                entry = list_directory(dirpath)
+            else:
+                mtime_ns = os.stat(dirpath).st_mtime_ns
+                entry = None if refresh else cache.get(dirpath, mtime_ns)
+                if entry is None:
+                    listed_ns = time.time_ns()
+                    entry = list_directory(dirpath, None if refresh else cache.previous(dirpath))
+                    cache.put(dirpath, mtime_ns, listed_ns, entry)
+        except OSError:
+            continue
+
+        pending.extend(os.path.join(dirpath, name) for name in entry["dirs"])
+        found.extend((os.path.join(dirpath, name), size) for name, size in entry["workbooks"])
+        if archives:
+            for record in entry["archives"]:
+                archive_path = os.path.join(dirpath, record[0])
+                found.extend((archive_path + suffix, size)
+                             for suffix, size in archive_members(archive_path, record))
+    found.sort()
+    return found
+
+class ScanProgress:
+    """Byte-weighted scan progress with live throughput and a smoothed ETA"""
+
+    def __init__(self, total_files, total_bytes, smoothing=0.3):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done_files = 0
+        self.done_bytes = 0
+        # Executor backend chosen for the scan
+        self.backend = None
+        self._smoothing = smoothing
+        self._start = self._last_time = time.monotonic()
+        self._last_files = 0
+        self._last_bytes = 0
+        self._byte_rate = None
+        self._file_rate = None
+
+    def advance(self, nbytes):
+        """Record one completed file of nbytes"""
+        self.done_files += 1
+        self.done_bytes += nbytes
+
+    @property
+    def fraction(self):
+        if self.total_bytes > 0:
+            return min(1.0, self.done_bytes / self.total_bytes)
+        return self.done_files / self.total_files if self.total_files else 1.0
+
+    def sample(self):
+        """Fold the work done since the last sample into the smoothed rates"""
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        if elapsed <= 0:
+            return
+        byte_rate = (self.done_bytes - self._last_bytes) / elapsed
+        file_rate = (self.done_files - self._last_files) / elapsed
+        if self._byte_rate is None:
+            # Seed with the average so far rather than a single noisy interval
+            total_elapsed = max(now - self._start, 1e-6)
+            self._byte_rate = self.done_bytes / total_elapsed
+            self._file_rate = self.done_files / total_elapsed
+        else:
+            a = self._smoothing
+            self._byte_rate += a * (byte_rate - self._byte_rate)
+            self._file_rate += a * (file_rate - self._file_rate)
+        self._last_time = now
+        self._last_bytes = self.done_bytes
+        self._last_files = self.done_files
+
+    @property
+    def mb_per_second(self):
+        return (self._byte_rate or 0.0) / (1024 * 1024)
+
+    @property
+    def files_per_second(self):
+        return self._file_rate or 0.0
+
+    @property
+    def eta_seconds(self):
+        """Seconds left at the smoothed byte rate, or None before any progress"""
+        if not self._byte_rate:
+            return None
+        return max(0.0, (self.total_bytes - self.done_bytes) / self._byte_rate)
+
+    def describe(self):
+        eta = self.eta_seconds
+        if eta is None:
+            eta_text = "--:--"
+        else:
+            minutes, seconds = divmod(int(eta + 0.5), 60)
+            hours, minutes = divmod(minutes, 60)
+            eta_text = f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+        return (f"{self.fraction * 100:.1f}% - {self.done_files}/{self.total_files} files - "
+                f"{self.mb_per_second:.1f} MB/s, {self.files_per_second:.1f} files/s - ETA {eta_text}")
+
+# Parse memory model: a worker's baseline plus multiples of the uncompressed
+# parts openpyxl keeps resident (shared strings, styles) and of the largest
+# sheet, which read-only mode streams
+WORKER_BASE_MEMORY = 64 * 1024 * 1024
+RESIDENT_PART_FACTOR = 4
+SHEET_PART_FACTOR = 0.5
+RESIDENT_PARTS = ("xl/sharedStrings.xml", "xl/styles.xml", "xl/workbook.xml")
+
+def estimate_parse_memory(source):
+    """Estimate the peak memory of parsing a workbook from its zip directory"""
+    resident = largest_sheet = 0
+    try:
+        if isinstance(source, str) and is_archive_member(source):
+            source = read_source(source)
+        with zipfile.ZipFile(source) as zf:
+            for info in zf.infolist():
+                if info.filename in RESIDENT_PARTS:
+                    resident += info.file_size
+                elif info.filename.startswith("xl/worksheets/"):
+                    largest_sheet = max(largest_sheet, info.file_size)
+    except SOURCE_ERRORS:
+        # The parse worker reports the error; it needs no more than the baseline
+        pass
+    return int(WORKER_BASE_MEMORY + RESIDENT_PART_FACTOR * resident
+               + SHEET_PART_FACTOR * largest_sheet)
+
+def total_physical_memory():
+    """Installed RAM in bytes, or None if it cannot be determined"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            class MemoryStatusEx(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong),
+                            ("dwMemoryLoad", ctypes.c_ulong),
+                            ("ullTotalPhys", ctypes.c_ulonglong),
+                            ("ullAvailPhys", ctypes.c_ulonglong),
+                            ("ullTotalPageFile", ctypes.c_ulonglong),
+                            ("ullAvailPageFile", ctypes.c_ulonglong),
+                            ("ullTotalVirtual", ctypes.c_ulonglong),
+                            ("ullAvailVirtual", ctypes.c_ulonglong),
+                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+            status = MemoryStatusEx()
+            status.dwLength = ctypes.sizeof(MemoryStatusEx)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullTotalPhys
+            return None
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, OSError, ValueError):
+        return None
+
+class MemoryBudget:
+    """Admit parse tasks while their estimated memory fits a global budget"""
+
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.in_use = 0
+
+    def pick(self, candidates):
+        """Remove and return the largest candidate that fits, or None
+
+        candidates are (file_path, buffer, estimate) items. Big files go first
+        and small ones fill the remaining room; a file larger than the whole
+        budget is admitted only when nothing else is running.
+        """
+        best = None
+        for i, item in enumerate(candidates):
+            estimate = item[2]
+            if self.in_use and self.in_use + estimate > self.budget:
+                continue
+            if best is None or estimate > candidates[best][2]:
+                best = i
+        if best is None:
+            return None
+        item = candidates.pop(best)
+        self.in_use += item[2]
+        return item
+
+    def release(self, estimate):
+        self.in_use -= estimate
+
+class PeakMemory:
+    """Measure this process's peak resident memory over a block of work
+
+    Linux resets the kernel's high-water mark on entry; Windows samples the
+    working set on a background thread. Elsewhere, or when disabled because
+    other scans share the process, peak stays None.
+    """
+
+    SAMPLE_INTERVAL = 0.02
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.peak = None
+
+    def __enter__(self):
+        self.peak = None
+        self._sampler = None
+        self._hwm = False
+        if not self.enabled:
+            pass
+        elif sys.platform.startswith("linux"):
+            try:
+                with open("/proc/self/clear_refs", "w") as f:
+                    f.write("5")
+                self._hwm = True
+            except OSError:
+                pass
+        elif sys.platform == "win32":
+            self._stop = threading.Event()
+            self._sampler = threading.Thread(target=self._sample_working_set, daemon=True)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._hwm:
+            try:
+                with open("/proc/self/status") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            self.peak = int(line.split()[1]) * 1024
+                            break
+            except (OSError, ValueError):
+                pass
+        elif self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+        return False
+
+    def _sample_working_set(self):
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD),
+                        ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(ProcessMemoryCounters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        get_info = ctypes.windll.kernel32.K32GetProcessMemoryInfo
+        while True:
+            if get_info(process, ctypes.byref(counters), counters.cb):
+                self.peak = max(self.peak or 0, counters.WorkingSetSize)
+            if self._stop.wait(self.SAMPLE_INTERVAL):
+                return
+
+# Characters that make a target a regular expression rather than a literal
+REGEX_METACHARS = frozenset(".^$*+?{}[]\\|()")
+
+# Above this many literal targets, each cell is matched with one automaton pass
+# instead of one substring test per target
+AUTOMATON_THRESHOLD = 8
+
+class AhoCorasick:
+    """Multi-pattern substring search with a per-character cost independent of the pattern count"""
+
+    def __init__(self, words):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for word in words:
+            state = 0
+            for ch in word:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] += (word,)
+
+        # Link every state to the state of its longest proper suffix, breadth first
+        order = deque(self._goto[0].values())
+        while order:
+            state = order.popleft()
+            for ch, nxt in self._goto[state].items():
+                order.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Return the set of words occurring in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = set()
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+# Targets that also match typed cells: numbers without leading zeros, dates
+# as 2023-10-15, 2023/10/15 or 2023.10.15, and "low..high" ranges of either
+# (one bound may be left out)
+NUMBER_TARGET = re.compile(r"[+-]?(?:0|[1-9]\d*)(?:\.\d+)?")
+DATE_TARGET = re.compile(r"(\d{4})([-/.])(\d{1,2})\2(\d{1,2})")
+RANGE_TARGET = re.compile(r"\s*(.*?)\s*\.\.\s*(.*?)\s*")
+
+def parse_typed_value(text):
+    """A number or date written as a target, or None"""
+    if NUMBER_TARGET.fullmatch(text):
+        return float(text) if "." in text else int(text)
+    match = DATE_TARGET.fullmatch(text)
+    if match:
+        try:
+            return datetime.date(int(match[1]), int(match[3]), int(match[4]))
+        except ValueError:
+            return None
+    return None
+
+def parse_range(text):
+    """(low, high) for a "low..high" target of numbers or dates, None for an open end"""
+    match = RANGE_TARGET.fullmatch(text)
+    if match is None or not (match[1] or match[2]):
+        return None
+    bounds = [parse_typed_value(b) if b else None for b in match.groups()]
+    if any(b is None for b, text in zip(bounds, match.groups()) if text):
+        return None
+    kinds = {isinstance(b, datetime.date) for b in bounds if b is not None}
+    if len(kinds) > 1:
+        return None
+    return tuple(bounds)
+
+class TargetMatcher:
+    """Find which search targets occur in a cell string, or match a typed cell
+
+    Literal targets are matched together, so the cost per cell stays the same
+    however many targets there are. Regex targets are compiled once.
+    Targets that look like a number or date also match number and date
+    cells by value (search_value), without formatting cells as text; range
+    targets ("10..20", "2023-01-01..2023-06-30") match typed cells only.
+    """
+
+    def __init__(self, targets, case_sensitive=False, use_regex=False):
+        self.case_sensitive = case_sensitive
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self._patterns = []
+        self._literals = {}
+        self._numbers = {}
+        self._dates = {}
+        self._number_ranges = []  # (low, high, target), None for an open end
+        self._date_ranges = []
+        for t in targets:
+            bounds = parse_range(t)
+            if bounds is not None:
+                dated = any(isinstance(b, datetime.date) for b in bounds)
+                (self._date_ranges if dated else self._number_ranges).append((*bounds, t))
+                continue
+            value = parse_typed_value(t)
+            if isinstance(value, datetime.date):
+                self._dates.setdefault(value, []).append(t)
+            elif value is not None:
+                # 20231015 and 20231015.0 hash alike, so cells of either type match
+                self._numbers.setdefault(value, []).append(t)
+
+            if use_regex and not REGEX_METACHARS.isdisjoint(t):
+                try:
+                    self._patterns.append((t, re.compile(t, flags)))
+                    continue
+                except re.error:
+                    # Invalid regex, fall back to literal search
+                    pass
+            key = t if case_sensitive else t.lower()
+            self._literals.setdefault(key, []).append(t)
+
+        self._min_len = min(map(len, self._literals), default=0)
+        # Whether non-string cells need looking at
+        self.typed = bool(self._numbers or self._dates or self._number_ranges
+                          or self._date_ranges)
+        if len(self._literals) > AUTOMATON_THRESHOLD:
+            self._automaton = AhoCorasick(self._literals)
+        else:
+            self._automaton = None
+
+    def search(self, cell, found):
+        """Add every target occurring in cell to found"""
+        if self._literals and len(cell) >= self._min_len:
+            text = cell if self.case_sensitive else cell.lower()
+            if self._automaton is not None:
+                for key in self._automaton.find(text):
+                    found.update(self._literals[key])
+            else:
+                for key, targets in self._literals.items():
+                    if key in text:
+                        found.update(targets)
+
+        for t, pattern in self._patterns:
+            if t not in found and pattern.search(cell):
+                found.add(t)
+
+    def search_value(self, value, found):
+        """Add every number, date or range target matching a non-string cell value to found"""
+        if isinstance(value, (int, float)):
+            # bool is an int, but True is no match for 1
+            if isinstance(value, bool):
+                return
+            targets = self._numbers.get(value)
+            if targets:
+                found.update(targets)
+            for low, high, t in self._number_ranges:
+                if (low is None or low <= value) and (high is None or value <= high):
+                    found.add(t)
+        elif isinstance(value, datetime.date):
+            day = value.date() if isinstance(value, datetime.datetime) else value
+            targets = self._dates.get(day)
+            if targets:
+                found.update(targets)
+            for low, high, t in self._date_ranges:
+                if (low is None or low <= day) and (high is None or day <= high):
+                    found.add(t)
+
+    def match(self, value, found):
+        """search() for strings, search_value() for anything else"""
+        if isinstance(value, str):
+            self.search(value, found)
+        elif value is not None:
+            self.search_value(value, found)
+
+_matcher_cache = {}
+
+def get_matcher(targets_set, case_sensitive=False, use_regex=False):
+    """Build a TargetMatcher once per worker process and reuse it for every file"""
+    key = (frozenset(targets_set), case_sensitive, use_regex)
+    matcher = _matcher_cache.get(key)
+    if matcher is None:
+        _matcher_cache.clear()
+        matcher = _matcher_cache[key] = TargetMatcher(targets_set, case_sensitive, use_regex)
+    return matcher
+
+def read_target_file(file_path):
+    """Read search targets from a text file (one per line) or a CSV file (first column)"""
+    targets = []
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+        if file_path.lower().endswith(".csv"):
+            import csv
+            sample = f.read(64 * 1024)
+            f.seek(0)
+            rows = csv.reader(f)
+            try:
+                if sample and csv.Sniffer().has_header(sample):
+                    next(rows, None)
+            except csv.Error:
+                pass
+            values = (row[0] for row in rows if row)
+        else:
+            values = (line for line in f if not line.lstrip().startswith("#"))
+
+        for value in values:
+            value = value.strip()
+            if value:
+                targets.append(value)
+
+    # Drop duplicates, keeping the file order
+    return list(dict.fromkeys(targets))
+
+# Scan modes: "values" searches the cached cell values through openpyxl,
+# "formulas" also searches formula text, reading both from the sheet XML, and
+# "metadata" only searches sheet names, defined names, comments and document
+# properties without opening any sheet
+SCAN_MODES = ("values", "formulas", "metadata")
+
+# Cell-level hits kept per file when ScanOptions.cell_details is on, and the
+# longest cell text stored with each
+CELL_DETAIL_LIMIT = 1000
+CELL_TEXT_LIMIT = 500
+
+# Rows a split sheet subtask reads between checks of the flags the other
+# sheets of its workbook have set
+FLAG_POLL_ROWS = 256
+
+def record_hits(matcher, value, found, cells, sheet, ref, where):
+    """Match a cell value and append a (target, sheet, cell, found_in, text) row per target it contains"""
+    hits = set()
+    matcher.match(value, hits)
+    if not hits:
+        return
+    found |= hits
+    # Only typed cells that matched are turned into text
+    text = value if isinstance(value, str) else str(value)
+    for t in sorted(hits):
+        if len(cells) < CELL_DETAIL_LIMIT:
+            cells.append((t, sheet, ref, where, text[:CELL_TEXT_LIMIT]))
+
+def search_done(found_count, target_count, cells=None, query=None):
+    """Whether the rest of a file can be skipped
+
+    That is once every target was found, or with a query once its outcome
+    is decided, but never while cell details are still being collected.
+    """
+    if cells is not None and len(cells) < CELL_DETAIL_LIMIT:
+        return False
+    if query is not None:
+        return query.decided
+    return found_count == target_count
+
+def search_values(source, matcher, target_count, cells=None, query=None):
+    """Search cached cell values; returns {target: {"value"}}
+
+    With a cells list, every hit is also recorded there (see record_hits).
+    With a query (a QueryEvaluation), the targets found in each row are fed
+    to it, and reading stops once it is decided.
+    """
+    # Use read_only=True for faster loading and lower memory usage
+    wb = load_workbook(source, data_only=True, read_only=True)
+    gate = row_gate()
+    # Number and date cells only need a look for number, date or range targets
+    typed = matcher.typed
+    found_targets = set()
+    # A query needs the targets of each row on their own
+    hits = set() if query is not None else found_targets
+
+    for sheet in wb.sheetnames:
+        # Early exit if all targets found
+        if search_done(len(found_targets), target_count, cells, query):
+            break
+
+        ws = wb[sheet]
+        for row_number, row in enumerate(ws.iter_rows(values_only=True), 1):
+            # Early exit if all targets found
+            if search_done(len(found_targets), target_count, cells, query):
+                break
+            if gate is not None:
+                gate()
+
+            if cells is None:
+                for cell in row:
+                    if isinstance(cell, str):
+                        matcher.search(cell, hits)
+                    elif typed and cell is not None:
+                        matcher.search_value(cell, hits)
+            else:
+                for column, cell in enumerate(row, 1):
+                    if isinstance(cell, str) or typed and cell is not None:
+                        record_hits(matcher, cell, hits, cells, sheet,
+                                    f"{get_column_letter(column)}{row_number}", "value")
+
+            if query is not None and hits:
+                found_targets |= hits
+                query.add_row(hits)
+                hits = set()
+
+    wb.close()
+    return {t: {"value"} for t in found_targets}
+
+def search_formulas(source, matcher, target_count, cells=None, query=None):
+    """Search formula text and cached values in one pass; returns {target: {"value", "formula"}}"""
+    in_values = set()
+    in_formulas = set()
+    row_values = set() if query is not None else in_values
+    row_formulas = set() if query is not None else in_formulas
+    # Targets found in either place, and the set sizes it was last updated at
+    found_targets = set()
+    found_sizes = (0, 0)
+    gate = row_gate()
+    typed = matcher.typed
+
+    with zipfile.ZipFile(source) as zf:
+        shared_strings = read_shared_strings(zf)
+        # Date cells are serial numbers in the XML; typed targets need them as dates
+        dates = read_date_styles(zf) if typed else None
+        for sheet, part in sheet_parts(zf):
+            # Early exit if all targets found
+            if search_done(len(found_targets), target_count, cells, query):
+                break
+
+            for row in iter_sheet_rows(zf, part, shared_strings, refs=cells is not None,
+                                       dates=dates):
+                if gate is not None:
+                    gate()
+                if cells is None:
+                    for value, formula in row:
+                        if isinstance(value, str):
+                            matcher.search(value, row_values)
+                        elif typed and value is not None:
+                            matcher.search_value(value, row_values)
+                        if formula:
+                            matcher.search(formula, row_formulas)
+                else:
+                    for value, formula, ref in row:
+                        if isinstance(value, str) or typed and value is not None:
+                            record_hits(matcher, value, row_values, cells, sheet, ref, "value")
+                        if formula:
+                            record_hits(matcher, formula, row_formulas, cells, sheet, ref,
+                                        "formula")
+
+                if query is not None and (row_values or row_formulas):
+                    row_hits = row_values | row_formulas
+                    in_values |= row_values
+                    in_formulas |= row_formulas
+                    found_targets |= row_hits
+                    query.add_row(row_hits)
+                    row_values, row_formulas = set(), set()
+                elif (len(in_values), len(in_formulas)) != found_sizes:
+                    # Only rows with new finds grow the sets the matcher fills directly
+                    found_sizes = (len(in_values), len(in_formulas))
+                    found_targets |= in_values
+                    found_targets |= in_formulas
+
+                # Early exit if all targets found
+                if search_done(len(found_targets), target_count, cells, query):
+                    break
+
+    found = {t: {"value"} for t in in_values}
+    for t in in_formulas:
+        found.setdefault(t, set()).add("formula")
+    return found
+
+def search_metadata(source, matcher, target_count, cells=None, query=None):
+    """Search workbook metadata only; returns {target: {location, ...}}
+
+    For a query, each metadata item counts as a row of its own.
+    """
+    found = {}
+    with zipfile.ZipFile(source) as zf:
+        for location, text in iter_metadata(zf):
+            hits = set()
+            if cells is None:
+                matcher.search(text, hits)
+            else:
+                record_hits(matcher, text, hits, cells, "", "", location)
+            for t in hits:
+                found.setdefault(t, set()).add(location)
+            if query is not None and hits:
+                query.add_row(hits)
+                if search_done(len(found), target_count, cells, query):
+                    break
+    return found
+
+SEARCHES = {
+    "values": search_values,
+    "formulas": search_formulas,
+    "metadata": search_metadata,
+}
+
+@contextmanager
+def workbook_source(file_path, shared_buffer=None):
+    """Readable source for a workbook: its read-ahead buffer, an archive member copy or the path"""
+    if shared_buffer is None:
+        yield read_source(file_path) if is_archive_member(file_path) else file_path
+        return
+
+    shm = shared_memory.SharedMemory(name=shared_buffer[0])
+    reader = SharedBufferReader(shm.buf, shared_buffer[1])
+    try:
+        yield reader
+    finally:
+        reader.close()
+        shm.close()
+
+def scan_single_file(file_path, targets_set, case_sensitive=False, use_regex=False,
+                     shared_buffer=None, measure_memory=True, mode="values", cell_details=False,
+                     query=None, generation=None):
+    """Scan a single Excel file for target strings - optimized version
+
+    shared_buffer is an optional (shm_name, size) pair holding the file
+    contents already fetched by ReadAhead. The result always carries the
+    worker's peak memory while parsing, and "found" is empty when no
+    target matched; "matched_in" tells for each found target where it was
+    seen (a cell value, a formula or a metadata location). measure_memory must be
+    off when files are parsed on several threads of one process. With
+    cell_details, "cells" lists up to CELL_DETAIL_LIMIT individual hits.
+    With a query (the query text, whose terms are targets_set),
+    "query_match" tells whether the file satisfies it, and the file is
+    abandoned as soon as that is decided. generation is the WorkerPool scan
+    the task belongs to; the search gives up once that scan has ended.
+    """
+    if not start_task(generation):
+        return {"file": file_path, "error": "scan was cancelled", "peak_memory": None}
+    memory = PeakMemory(measure_memory)
+    cells = [] if cell_details else None
+    evaluation = get_query(query).evaluation() if query else None
+    try:
+        with memory, workbook_source(file_path, shared_buffer) as source:
+            matcher = get_matcher(targets_set, case_sensitive, use_regex)
+            found = SEARCHES[mode](source, matcher, len(targets_set), cells, evaluation)
+
+        return {"file": file_path, "found": list(found),
+                "matched_in": {t: sorted(where) for t, where in found.items()},
+                "cells": cells or [],
+                "query_match": evaluation.result() if evaluation else None,
+                "peak_memory": memory.peak}
+
+    except Exception as e:
+        return {"file": file_path, "error": str(e), "peak_memory": memory.peak}
+
+class SharedStringTable:
+    """A workbook's shared strings in one shared memory block, with a found flag per target
+
+    Lets the sheet subtasks of a split workbook look strings up by index
+    without each parsing sharedStrings.xml, and stop once every target has
+    been found by any of them. Layout: string count and flag count (int64),
+    one flag byte per target padded to 8 bytes, count + 1 int64 offsets,
+    then all strings as one UTF-8 blob.
+    """
+
+    def __init__(self, shm):
+        self._shm = shm
+        header = shm.buf[:16].cast("q")
+        self.count, flag_count = header[0], header[1]
+        header.release()
+        offsets_start = 16 + (flag_count + 7) // 8 * 8
+        blob_start = offsets_start + 8 * (self.count + 1)
+        self.flags = shm.buf[16:16 + flag_count]
+        self._offsets = shm.buf[offsets_start:blob_start].cast("q")
+        self._blob = shm.buf[blob_start:]
+
+    @classmethod
+    def create(cls, strings, flag_count):
+        encoded = [text.encode("utf-8") for text in strings]
+        offsets = array("q", [0])
+        offsets.extend(accumulate(len(data) for data in encoded))
+        offsets_start = 16 + (flag_count + 7) // 8 * 8
+        blob_start = offsets_start + 8 * len(offsets)
+        shm = shared_memory.SharedMemory(create=True, size=blob_start + offsets[-1])
+
+        buf = shm.buf
+        buf[:16] = array("q", [len(encoded), flag_count]).tobytes()
+        buf[16:offsets_start] = bytes(offsets_start - 16)
+        buf[offsets_start:blob_start] = offsets.tobytes()
+        position = blob_start
+        for data in encoded:
+            buf[position:position + len(data)] = data
+            position += len(data)
+        del buf
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+    def mark(self, index):
+        self.flags[index] = 1
+
+    def all_found(self):
+        return all(self.flags)
+
+    def seen(self):
+        """Indices of the flags set so far"""
+        return {i for i, flag in enumerate(self.flags.tobytes()) if flag}
+
+    def decided(self, plan=None):
+        """Whether the subtasks can stop: every target found, or the query plan's outcome known"""
+        if plan is None:
+            return self.all_found()
+        return plan.evaluate(self.seen()) is not None
+
+    def close(self, unlink=False):
+        self.flags.release()
+        self._offsets.release()
+        self._blob.release()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+def plan_split(file_path, shared_buffer, flag_count):
+    """List the worksheets of a large workbook and publish its shared strings for the subtasks
+
+    Returns ([(sheet_name, part)], table); table is None when there is
+    nothing to split (fewer than two worksheets), and the caller owns and
+    unlinks it.
+    """
+    with workbook_source(file_path, shared_buffer) as source, zipfile.ZipFile(source) as zf:
+        parts = sheet_parts(zf)
+        if len(parts) < 2:
+            return parts, None
+        return parts, SharedStringTable.create(read_shared_strings(zf), flag_count)
+
+def scan_sheet(file_path, sheet, part, targets_set, case_sensitive, use_regex, shared_buffer,
+               table_name, measure_memory=True, mode="values", cell_details=False, query=None,
+               generation=None):
+    """Search one worksheet of a split workbook
+
+    Strings are looked up in the shared table named table_name. Its flags
+    are the targets in sorted order, or with a query the facts of its plan.
+    Everything this sheet finds is flagged there, and the search stops as
+    soon as the flags settle the file (see SharedStringTable.decided),
+    whichever subtask set them; never while collecting cell details.
+    Returns {"found": {target: [where]}, "cells"} like scan_single_file's
+    matched_in and cells, or {"error"}, plus "peak_memory". generation is
+    as for scan_single_file.
+    """
+    if not start_task(generation):
+        return {"error": "scan was cancelled", "peak_memory": None}
+    table = None
+    memory = PeakMemory(measure_memory)
+    try:
+        with memory, workbook_source(file_path, shared_buffer) as source:
+            table = SharedStringTable.attach(table_name)
+            matcher = get_matcher(targets_set, case_sensitive, use_regex)
+            plan = get_query(query) if query else None
+            flag_of = {t: i for i, t in enumerate(sorted(targets_set))}
+            in_values = set()
+            in_formulas = set()
+            cells = [] if cell_details else None
+            marked = set()
+            rows_since_poll = 0
+            gate = row_gate()
+            typed = matcher.typed
+
+            with zipfile.ZipFile(source) as zf:
+                dates = read_date_styles(zf) if typed else None
+                for row in iter_sheet_rows(zf, part, table, refs=True, dates=dates):
+                    if gate is not None:
+                        gate()
+                    row_values = set()
+                    row_formulas = set()
+                    for value, formula, ref in row:
+                        if cells is not None:
+                            if isinstance(value, str) or typed and value is not None:
+                                record_hits(matcher, value, row_values, cells, sheet, ref, "value")
+                            if formula and mode == "formulas":
+                                record_hits(matcher, formula, row_formulas, cells, sheet, ref,
+                                            "formula")
+                            continue
+                        if isinstance(value, str):
+                            matcher.search(value, row_values)
+                        elif typed and value is not None:
+                            matcher.search_value(value, row_values)
+                        if formula and mode == "formulas":
+                            matcher.search(formula, row_formulas)
+
+                    # Share new finds, then stop if the flags from all sheets settle the
+                    # file: checked when this sheet marks a flag, and every
+                    # FLAG_POLL_ROWS rows for the other sheets' marks
+                    marked_now = False
+                    if row_values or row_formulas:
+                        row_hits = row_values | row_formulas
+                        if plan is not None:
+                            facts = plan.facts_in_row(row_hits)
+                        else:
+                            facts = {flag_of[t] for t in row_hits}
+                        for i in facts - marked:
+                            table.mark(i)
+                            marked.add(i)
+                            marked_now = True
+                        in_values |= row_values
+                        in_formulas |= row_formulas
+                    rows_since_poll += 1
+                    if marked_now or rows_since_poll >= FLAG_POLL_ROWS:
+                        rows_since_poll = 0
+                        if ((cells is None or len(cells) >= CELL_DETAIL_LIMIT)
+                                and table.decided(plan)):
+                            break
+
+        found = {t: ["value"] for t in in_values}
+        for t in in_formulas:
+            found.setdefault(t, []).append("formula")
+        return {"found": found, "cells": cells or [], "peak_memory": memory.peak}
+
+    except Exception as e:
+        return {"error": str(e), "peak_memory": memory.peak}
+
+    finally:
+        if table is not None:
+            table.close()
+
+class SplitWorkbook:
+    """A workbook being searched sheet by sheet, and its merged findings"""
+
+    def __init__(self, item, table, sheet_count, plan=None):
+        self.item = item  # (file_path, buffer, estimate) as admitted
+        self.table = table
+        self.plan = plan
+        self.queued = sheet_count
+        self.running = 0
+        self.found = {}
+        self.cells = []
+        self.error = None
+        self.peak_memory = None
+
+    def merge(self, future):
+        """Fold one finished scan_sheet into the workbook's result"""
+        try:
+            outcome = future.result()
+        except Exception as e:
+            outcome = {"error": str(e)}
+        peak = outcome.get("peak_memory")
+        if peak is not None:
+            self.peak_memory = max(self.peak_memory or 0, peak)
+        if "error" in outcome:
+            self.error = self.error or outcome["error"]
+            return
+        for t, where in outcome["found"].items():
+            self.found.setdefault(t, set()).update(where)
+        self.cells.extend(outcome["cells"][:CELL_DETAIL_LIMIT - len(self.cells)])
+
+    def decided(self):
+        return self.table.decided(self.plan)
+
+    def result(self, size):
+        """Merged ScanResult; call while the table is still open"""
+        file_path, _, estimate = self.item
+        result = ScanResult(file_path, size=size, estimated_memory=estimate,
+                            peak_memory=self.peak_memory)
+        if self.error:
+            result.error = self.error
+        else:
+            result.found = list(self.found)
+            result.matched_in = {t: sorted(where) for t, where in self.found.items()}
+            result.cells = self.cells
+            if self.plan is not None:
+                result.query_match = self.plan.evaluate(self.table.seen(), complete=True)
+        return result
+
+def discard_plan(future):
+    """Unlink the shared strings of a split plan that finished after its scan was abandoned"""
+    try:
+        _, table = future.result()
+    except Exception:
+        return
+    if table is not None:
+        table.close(unlink=True)
+
+# Executor backends: "process" runs one interpreter per worker, "thread" shares
+# this one (no spawn or pickling, but parses hold the GIL unless the build is
+# free-threaded) and "interpreter" uses a subinterpreter pool (Python 3.14+)
+EXECUTOR_BACKENDS = ("auto", "process", "thread", "interpreter")
+
+# "auto" picks threads when worker processes cannot run in parallel (one worker
+# or one CPU): bench_backends.py on 1 CPU, 20-row workbooks, threads won at
+# every size (32 files 0.09 s vs 0.17 s, 500 files 0.91 s vs 1.11 s). With
+# more CPUs it also picks threads for scans this small, where starting worker
+# processes (which re-import openpyxl under spawn, ~0.1 s) costs more than the
+# parses; run bench_backends.py on a multi-core machine to find its crossover
+THREAD_BACKEND_MAX_FILES = 32
+THREAD_BACKEND_MAX_BYTES = 4 * 1024 * 1024
+
+def gil_disabled():
+    """Whether this is a free-threaded build running without the GIL"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+def available_backends():
+    backends = ["process", "thread"]
+    if hasattr(concurrent.futures, "InterpreterPoolExecutor"):
+        backends.append("interpreter")
+    return backends
+
+def auto_picks_threads(max_workers):
+    """Whether "auto" picks threads for every scan with max_workers, whatever the corpus"""
+    if gil_disabled():
+        # Threads parse in parallel without spawn or pickling costs
+        return True
+    # A single worker process, or several sharing one CPU, gain no
+    # parallelism, only startup and IPC overhead
+    return min(max_workers, os.cpu_count() or 1) <= 1
+
+def select_backend(requested, file_count, total_bytes, max_workers, mode="values", warm=False):
+    """Resolve a backend name, choosing one for "auto" from the runtime and corpus profile
+
+    warm tells that a WorkerPool has processes running already, so small
+    scans no longer pay to start them.
+    """
+    if requested != "auto":
+        if requested not in available_backends():
+            raise ValueError(f"Executor backend '{requested}' is not available in this Python")
+        return requested
+
+    if auto_picks_threads(max_workers):
+        return "thread"
+    if mode == "metadata":
+        # Reading a few small zip members is I/O bound and cheaper than the IPC
+        return "thread"
+    if (not warm and file_count <= THREAD_BACKEND_MAX_FILES
+            and total_bytes <= THREAD_BACKEND_MAX_BYTES):
+        return "thread"
+    return "process"
+
+def create_executor(backend, max_workers, initializer=None, initargs=()):
+    if backend == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers, initializer=initializer,
+                                  initargs=initargs)
+    if backend == "interpreter":
+        return concurrent.futures.InterpreterPoolExecutor(max_workers=max_workers,
+                                                          initializer=initializer,
+                                                          initargs=initargs)
+    # Forking while the read-ahead threads hold locks can deadlock the child,
+    # so start workers fresh everywhere, as Windows already does
+    return ProcessPoolExecutor(max_workers=max_workers,
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=initializer, initargs=initargs)
+
+# Background mode. Workers run niced on POSIX, at the lowest best-effort I/O
+# priority on Linux (set through the ioprio_set syscall, which Python does not
+# wrap) and in Windows' background processing mode, which lowers CPU, I/O and
+# memory priority together
+BACKGROUND_NICE = 10
+IOPRIO_SET_SYSCALLS = {"x86_64": 251, "aarch64": 30, "i386": 289, "i686": 289}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_BEST_EFFORT_LOWEST = (2 << 13) | 7
+PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+
+# Files are read in pieces this large when ScanOptions.read_limit_mb paces them
+READ_LIMIT_CHUNK = 1024 * 1024
+
+# Background scans leave this many cores idle: a worker is dropped when less
+# is idle and added back once a whole core more is, checked every interval
+BACKGROUND_IDLE_CORES = 1.0
+LOAD_SAMPLE_INTERVAL = 1.0
+
+def lower_priority(thread_only=False):
+    """Run the calling worker at background CPU and I/O priority, where the platform allows
+
+    With thread_only, only the calling thread is lowered, and nothing is
+    where priority belongs to the whole process, since that would be the GUI's.
+    """
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            if thread_only:
+                kernel32.SetThreadPriority(kernel32.GetCurrentThread(),
+                                           THREAD_MODE_BACKGROUND_BEGIN)
+            else:
+                kernel32.SetPriorityClass(kernel32.GetCurrentProcess(),
+                                          PROCESS_MODE_BACKGROUND_BEGIN)
+            return
+
+        linux = sys.platform.startswith("linux")
+        if linux:
+            # Linux keeps niceness and I/O priority per thread
+            who = threading.get_native_id()
+        elif thread_only:
+            return
+        else:
+            who = 0
+        if os.getpriority(os.PRIO_PROCESS, who) < BACKGROUND_NICE:
+            os.setpriority(os.PRIO_PROCESS, who, BACKGROUND_NICE)
+        syscall = IOPRIO_SET_SYSCALLS.get(platform.machine()) if linux else None
+        if syscall is not None:
+            import ctypes
+            ctypes.CDLL(None).syscall(syscall, IOPRIO_WHO_PROCESS, who,
+                                      IOPRIO_BEST_EFFORT_LOWEST)
+    except (AttributeError, OSError):
+        # Lower priority is a courtesy; scan at normal priority without it
+        pass
+
+class CpuGovernor:
+    """Hold the calling thread's CPU time to a share of wall time by sleeping
+
+    Search loops call pace() once per row; every WINDOW seconds it sleeps
+    off whatever CPU time went over the share.
+    """
+
+    WINDOW = 0.05
+
+    def __init__(self, share):
+        self.share = share
+        self._start = time.monotonic()
+        self._cpu = time.thread_time()
+
+    def pace(self):
+        now = time.monotonic()
+        elapsed = now - self._start
+        if elapsed < self.WINDOW:
+            return
+        owed = (time.thread_time() - self._cpu) / self.share - elapsed
+        if owed > 0:
+            time.sleep(owed)
+        self._start = time.monotonic()
+        self._cpu = time.thread_time()
+
+# Per worker thread: its CpuGovernor (init_background_worker), the scan
+# generation of its WorkerPool (init_pool_worker) and the generation of the
+# task it is running
+_worker_state = threading.local()
+
+class ScanSuperseded(Exception):
+    """Raised in a pooled worker whose task belongs to a scan that has ended"""
+
+def row_gate():
+    """Callback for the search loops to run once per row, or None if there is nothing to do
+
+    It paces the worker to its CPU share in background mode, and in a
+    WorkerPool raises ScanSuperseded once the task's scan has ended.
+    """
+    governor = getattr(_worker_state, "governor", None)
+    generation = getattr(_worker_state, "generation", None)
+    task = getattr(_worker_state, "task_generation", None)
+    if generation is None or task is None:
+        return governor.pace if governor is not None else None
+
+    def gate():
+        if generation.value != task:
+            raise ScanSuperseded("scan was cancelled")
+        if governor is not None:
+            governor.pace()
+    return gate
+
+def start_task(generation):
+    """Note the scan generation of the task starting on this worker; False if that scan has ended"""
+    _worker_state.task_generation = generation
+    shared = getattr(_worker_state, "generation", None)
+    return generation is None or shared is None or shared.value == generation
+
+def init_background_worker(cpu_share=1.0, thread_only=False):
+    """Executor initializer for background scans: lower priority and cap the worker's CPU share"""
+    lower_priority(thread_only)
+    _worker_state.governor = CpuGovernor(cpu_share) if cpu_share < 1 else None
+
+def init_pool_worker(generation, background=False, cpu_share=1.0):
+    """Executor initializer for WorkerPool processes"""
+    _worker_state.generation = generation
+    if background:
+        init_background_worker(cpu_share)
+
+def warm_worker():
+    """No-op task that starts a pool worker, which imports this module and openpyxl on the way"""
+    return os.getpid()
+
+class WorkerPool:
+    """Worker processes kept alive across scans, so spawning and imports are paid once
+
+    Pass it to scan(pool=...) from a long-lived program such as the GUI. Each
+    scan takes a new generation number from the pool; when the scan ends or
+    is cancelled the number moves on, its queued tasks are dropped and its
+    running tasks stop at their next row (ScanSuperseded), leaving the
+    workers warm. A pool broken by a crashed worker, or started with other
+    worker settings, is replaced for the next scan.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._settings = None
+        self._generation = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _settings_for(options):
+        workers = options.worker_count()
+        return workers, options.background, options.cpu_share(workers)
+
+    def acquire(self, options):
+        """Return (executor, generation) for a new scan with these options"""
+        settings = self._settings_for(options)
+        with self._lock:
+            if self._executor is not None and self._settings != settings:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._executor is None:
+                context = multiprocessing.get_context("spawn")
+                self._generation = context.RawValue("q", 0)
+                workers, background, cpu_share = settings
+                self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                     initializer=init_pool_worker,
+                                                     initargs=(self._generation, background,
+                                                               cpu_share))
+                self._settings = settings
+            self._generation.value += 1
+            return self._executor, self._generation.value
+
+    def release(self, generation):
+        """End a scan's generation, so its tasks still running stop early"""
+        with self._lock:
+            if self._generation is not None and self._generation.value == generation:
+                self._generation.value += 1
+
+    def discard(self, executor):
+        """Drop a broken executor; the next scan starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self, options):
+        """Start every worker now rather than on the first scan"""
+        executor, generation = self.acquire(options)
+        try:
+            for _ in range(self._settings[0]):
+                executor.submit(warm_worker)
+        except BrokenProcessPool:
+            self.discard(executor)
+        self.release(generation)
+
+    def shutdown(self):
+        """Stop the workers; running tasks are told to give up rather than waited for"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if self._generation is not None:
+                self._generation.value += 1
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+class RateLimiter:
+    """Token bucket shared by the read-ahead threads to cap their combined bandwidth"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate  # up to a second's worth of burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        """Take nbytes from the bucket; returns the seconds to sleep before reading more"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= nbytes
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+def system_cpu_times():
+    """Cumulative (idle, total) CPU time of the whole machine, or None if unavailable"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            idle, kernel, user = (wintypes.FILETIME() for _ in range(3))
+            if not ctypes.windll.kernel32.GetSystemTimes(ctypes.byref(idle), ctypes.byref(kernel),
+                                                        ctypes.byref(user)):
+                return None
+            ticks = [t.dwHighDateTime << 32 | t.dwLowDateTime for t in (idle, kernel, user)]
+            # Kernel time includes idle time
+            return ticks[0], ticks[1] + ticks[2]
+        with open("/proc/stat") as f:
+            fields = [int(v) for v in f.readline().split()[1:9]]
+        # user nice system idle iowait irq softirq steal
+        return fields[3] + fields[4], sum(fields)
+    except (AttributeError, OSError, ValueError, IndexError):
+        return None
+
+class LoadMonitor:
+    """Adapt the number of parses in flight to how busy the machine is
+
+    Starts with one and adds a worker per LOAD_SAMPLE_INTERVAL while more
+    than BACKGROUND_IDLE_CORES + 1 cores are idle, up to max_workers;
+    drops one whenever fewer than BACKGROUND_IDLE_CORES are.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.limit = 1
+        self._cores = os.cpu_count() or 1
+        self._last_sample = time.monotonic()
+        self._last_times = system_cpu_times()
+
+    def update(self):
+        """Sample the load if due and return the current limit"""
+        now = time.monotonic()
+        if now - self._last_sample < LOAD_SAMPLE_INTERVAL:
+            return self.limit
+        self._last_sample = now
+        idle = self.idle_cores()
+        if idle is None:
+            return self.limit
+        if idle < BACKGROUND_IDLE_CORES:
+            self.limit = max(1, self.limit - 1)
+        elif idle >= BACKGROUND_IDLE_CORES + 1:
+            self.limit = min(self.max_workers, self.limit + 1)
+        return self.limit
+
+    def idle_cores(self):
+        """Cores' worth of CPU left idle since the last sample, or None if unknown"""
+        times = system_cpu_times()
+        if times is None:
+            try:
+                return self._cores - os.getloadavg()[0]
+            except (AttributeError, OSError):
+                return None
+        previous, self._last_times = self._last_times, times
+        if previous is None or times[1] <= previous[1]:
+            return None
+        return self._cores * (times[0] - previous[0]) / (times[1] - previous[1])
+
+@dataclass
+class ScanOptions:
+    """Search and scheduling options for scan()"""
+    case_sensitive: bool = False
+    use_regex: bool = False
+    # Use max 4 processes to avoid overwhelming the system
+    max_workers: int = field(default_factory=lambda: min(4, multiprocessing.cpu_count()))
+    # Read-ahead I/O stage (0 threads disables it)
+    read_ahead_threads: int = 4
+    read_ahead_mb: int = 256
+    # Memory budget for concurrent parses (0 = half of installed RAM)
+    memory_budget_mb: int = 0
+    # One of EXECUTOR_BACKENDS
+    backend: str = "auto"
+    # One of SCAN_MODES
+    mode: str = "values"
+    # Also scan workbooks inside .zip archives, reported as "a.zip!/TD_x.xlsx"
+    scan_archives: bool = True
+    # DiscoveryCache file for directory listings (None disables it), and
+    # whether to ignore it and list every directory again
+    discovery_cache: str = None
+    refresh_discovery: bool = False
+    # Workbooks at least this large are split into per-sheet subtasks (0 disables)
+    split_threshold_mb: int = 32
+    # Record each matching cell (up to CELL_DETAIL_LIMIT per file) in ScanResult.cells;
+    # files are then read to the end instead of stopping once every target is found
+    cell_details: bool = False
+    # Boolean query over targets (see query.py) instead of matching any target
+    query: str = None
+    # Journal file for resuming an interrupted scan (None disables it), and
+    # whether to resume from it rather than start over
+    checkpoint: str = None
+    resume: bool = False
+    # Low-impact mode: workers at background priority, fewer of them while the
+    # machine is busy, their combined CPU use capped to a percentage of all
+    # cores and read-ahead capped to MB/s (0 = no cap). Workers that read
+    # files themselves (no read-ahead) are not paced
+    background: bool = False
+    cpu_limit_percent: int = 50
+    read_limit_mb: float = 32
+
+    def memory_budget_bytes(self):
+        if self.memory_budget_mb > 0:
+            return self.memory_budget_mb * 1024 * 1024
+        total = total_physical_memory()
+        return total // 2 if total else 4096 * 1024 * 1024
+
+    def cpu_limit_cores(self):
+        """Cores' worth of CPU the workers may use together, or None if uncapped"""
+        if not self.background or self.cpu_limit_percent <= 0:
+            return None
+        return max(0.05, self.cpu_limit_percent / 100 * (os.cpu_count() or 1))
+
+    def worker_count(self):
+        """Workers for the scan; a CPU cap of a few cores needs no more than that"""
+        workers = max(1, self.max_workers)
+        cores = self.cpu_limit_cores()
+        return workers if cores is None else min(workers, math.ceil(cores))
+
+    def cpu_share(self, workers):
+        """Share of a core each of workers may use (1.0 when uncapped)"""
+        cores = self.cpu_limit_cores()
+        return min(1.0, cores / workers) if cores is not None else 1.0
+
+@dataclass
+class ScanResult:
+    """Outcome of scanning one workbook"""
+    file: str
+    found: list = field(default_factory=list)
+    error: str = None
+    # Where each found target was seen: "value", "formula" or a metadata location
+    matched_in: dict = field(default_factory=dict)
+    size: int = 0
+    # Estimated and measured peak worker memory in bytes (peak is None if unmeasured)
+    estimated_memory: int = 0
+    peak_memory: int = None
+    # (target, sheet, cell, found_in, text) per hit, with ScanOptions.cell_details
+    cells: list = field(default_factory=list)
+    # Whether the file satisfies ScanOptions.query (None without a query)
+    query_match: bool = None
+
+class CancelToken:
+    """Thread-safe flag that stops a running scan()"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+# Seconds between checkpoint flushes to disk
+CHECKPOINT_INTERVAL = 10.0
+CHECKPOINT_VERSION = 1
+
+class CheckpointError(ValueError):
+    """Raised when a scan cannot resume from its checkpoint"""
+
+def scan_fingerprint(root, targets_set, options):
+    """Identify what a scan searches for, so a checkpoint is only resumed by the same scan"""
+    settings = {"root": os.path.abspath(root), "targets": sorted(targets_set),
+                "query": options.query, "case_sensitive": options.case_sensitive,
+                "use_regex": options.use_regex, "mode": options.mode,
+                "cell_details": options.cell_details, "scan_archives": options.scan_archives}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+def file_stamp(file_path):
+    """[mtime_ns, size] of the file on disk holding a workbook (the outer archive for members)"""
+    stat = os.stat(split_archive_path(file_path)[0])
+    return [stat.st_mtime_ns, stat.st_size]
+
+class ScanCheckpoint:
+    """Journal of completed files that lets an interrupted scan resume
+
+    A JSONL file: a header line with the scan fingerprint, then one line per
+    completed file with its stamp (see file_stamp) and ScanResult. Files
+    that failed (a dropped share, a crashed worker) are left out, so a
+    resumed scan tries them again. Lines are
+    only appended, and tick(), which scan() calls on every pass of its loop,
+    flushes them every CHECKPOINT_INTERVAL seconds, so a crash loses at most
+    that much work; a torn last line is ignored on load.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._file = None
+        self._pending = False
+        self._last_flush = time.monotonic()
+
+    def load(self):
+        """{file_path: (stamp, ScanResult)} from the checkpoint, which must belong to this scan"""
+        try:
+            f = open(self.path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            raise CheckpointError("There is no unfinished scan to resume")
+        completed = {}
+        with f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                raise CheckpointError("The checkpoint file is damaged")
+            if header.get("version") != CHECKPOINT_VERSION or \
+                    header.get("fingerprint") != self.fingerprint:
+                raise CheckpointError("The checkpoint was saved for a different folder, "
+                                      "targets or search options")
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write at the end of the journal
+                    break
+                if entry["result"].get("error"):
+                    # Journaled before failures were left out; scan it again
+                    continue
+                completed[entry["result"]["file"]] = (entry["stamp"], ScanResult(**entry["result"]))
+        return completed
+
+    def start(self, completed=()):
+        """Begin a fresh journal holding the given (stamp, ScanResult) entries"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"version": CHECKPOINT_VERSION,
+                                "fingerprint": self.fingerprint}) + "\n")
+            for stamp, result in completed:
+                self._write_entry(f, stamp, result)
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _write_entry(self, f, stamp, result):
+        f.write(json.dumps({"stamp": stamp, "result": asdict(result)}, ensure_ascii=False) + "\n")
+
+    def record(self, result):
+        if result.error:
+            # Not done: the error may be gone by the time the scan resumes
+            return
+        try:
+            stamp = file_stamp(result.file)
+        except OSError:
+            # Gone already; it will simply be scanned again
+            return
+        self._write_entry(self._file, stamp, result)
+        self._pending = True
+        self.tick()
+
+    def tick(self):
+        """Flush entries recorded since the last flush once CHECKPOINT_INTERVAL has passed"""
+        now = time.monotonic()
+        if self._pending and now - self._last_flush >= CHECKPOINT_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = False
+        self._last_flush = time.monotonic()
+
+    def close(self, finished=False):
+        """Flush the journal, or delete it once the scan has finished"""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+        if finished:
+            os.remove(self.path)
+
+def scan(root, targets, options=None, cancel=None, progress=None, pool=None):
+    """Scan the TD workbooks under root, yielding a ScanResult per file as it completes
+
+    Every file yields a result, with an empty found list when nothing matched.
+    progress, if given, is called with a ScanProgress after discovery and then
+    at most every PROGRESS_INTERVAL seconds; it runs on the iterating thread.
+    Cancelling the token, or closing the generator, stops the scan.
+    Worker processes are spawned, re-importing the calling script's
+    __main__ module, so a script calling scan() must do so under
+    if __name__ == "__main__": or process scans fail with BrokenProcessPool.
+    With options.query set, targets is ignored in favour of the query's
+    terms and each result tells whether the file matched the query.
+
+    With options.checkpoint, files completed without error are journaled
+    there and the journal is deleted once every file is done. options.resume
+    first yields the results saved for files that are unchanged since, then
+    scans only the rest (progress covers the rest only); it raises
+    CheckpointError if the checkpoint is missing or was made for another
+    folder or search.
+
+    pool, a WorkerPool, runs the process backend on warm workers that
+    outlive the scan instead of starting a pool for it.
+    """
+    options = options or ScanOptions()
+    cancel = cancel or CancelToken()
+    # A query brings its own terms to search for
+    plan = get_query(options.query) if options.query else None
+    targets_set = set(plan.terms) if plan is not None else set(targets)
+
+    checkpoint = None
+    completed = {}
+    if options.checkpoint:
+        checkpoint = ScanCheckpoint(options.checkpoint, scan_fingerprint(root, targets_set, options))
+        if options.resume:
+            completed = checkpoint.load()
+
+    # First, collect all Excel file paths with their sizes
+    cache = DiscoveryCache(options.discovery_cache) if options.discovery_cache else None
+    file_sizes = dict(discover_files(root, options.scan_archives, cache,
+                                     options.refresh_discovery))
+    if cache is not None:
+        try:
+            cache.save(root)
+        except OSError:
+            # The scan works without it; the next one just lists everything again
+            pass
+
+    # Checkpointed files are only skipped if their file on disk is unchanged
+    resumed = []
+    stamps = {}
+    for file_path, (stamp, result) in completed.items():
+        if file_path not in file_sizes:
+            continue
+        holder = split_archive_path(file_path)[0]
+        if holder not in stamps:
+            try:
+                stamps[holder] = file_stamp(holder)
+            except OSError:
+                stamps[holder] = None
+        if stamps[holder] == stamp:
+            resumed.append((stamp, result))
+            del file_sizes[file_path]
+    if checkpoint is not None:
+        checkpoint.start(resumed)
+
+    # Largest files first, so small ones can fill the gaps at the end
+    file_paths = sorted(file_sizes, key=file_sizes.get, reverse=True)
+
+    scan_progress = ScanProgress(len(file_paths), sum(file_sizes.values()))
+    # A CPU cap of a few cores needs no more workers than that, each held to its share
+    max_workers = options.worker_count()
+    scan_progress.backend = backend = select_backend(options.backend, scan_progress.total_files,
+                                                     scan_progress.total_bytes, max_workers,
+                                                     options.mode, warm=pool is not None)
+    if progress is not None:
+        progress(scan_progress)
+    # Results restored from the checkpoint come first
+    for _, result in resumed:
+        yield result
+    if not file_paths or cancel.cancelled:
+        if checkpoint is not None:
+            checkpoint.close(finished=not file_paths)
+        return
+
+    budget = MemoryBudget(options.memory_budget_bytes())
+    candidates = []  # (file_path, buffer, estimate) waiting for admission
+    tasks = {}  # future -> ("file" | "plan", item) or ("sheet", SplitWorkbook)
+    last_update = time.monotonic()
+
+    # Fetch file contents on I/O threads so network reads overlap parsing.
+    # Subinterpreters cannot attach the shared memory blocks, so they read files
+    # themselves, and metadata scans only read a few members of each zip
+    if options.mode == "metadata":
+        read_ahead = None
+        candidates = [(fp, None, WORKER_BASE_MEMORY) for fp in file_paths]
+    elif options.read_ahead_threads > 0 and backend != "interpreter":
+        limiter = None
+        if options.background and options.read_limit_mb > 0:
+            limiter = RateLimiter(options.read_limit_mb * 1024 * 1024)
+        read_ahead = ReadAhead(file_paths, options.read_ahead_threads,
+                               options.read_ahead_mb * 1024 * 1024, file_sizes,
+                               limiter, options.background)
+        read_ahead.start()
+    else:
+        read_ahead = None
+        with ThreadPoolExecutor(max_workers=8) as estimator:
+            estimates = estimator.map(estimate_parse_memory, file_paths)
+            candidates = [(fp, None, est) for fp, est in zip(file_paths, estimates)]
+
+    generation = None
+    if pool is not None and backend == "process":
+        executor, generation = pool.acquire(options)
+    elif options.background:
+        # Thread and interpreter workers share the caller's process, so only they are lowered
+        executor = create_executor(backend, max_workers, init_background_worker,
+                                   (options.cpu_share(max_workers), backend != "process"))
+    else:
+        executor = create_executor(backend, max_workers)
+    # Busy machines get fewer parses in flight
+    load = LoadMonitor(max_workers) if options.background else None
+    # Per-file peak memory is meaningless when parses share one process, as
+    # thread and interpreter workers do
+    measure_memory = backend == "process"
+
+    def submit(fn, *args):
+        # Tasks take the pool generation as their last argument
+        nonlocal executor, generation
+        try:
+            return executor.submit(fn, *args, generation)
+        except BrokenProcessPool:
+            if generation is None:
+                raise
+            # A pooled worker died, now or between scans: go on with fresh workers.
+            # Tasks that were running on it come back as errors
+            pool.discard(executor)
+            executor, generation = pool.acquire(options)
+            return executor.submit(fn, *args, generation)
+
+    def submit_file(item):
+        fp, buffer, _ = item
+        return submit(scan_single_file, fp, targets_set,
+                      options.case_sensitive, options.use_regex, buffer,
+                      measure_memory, options.mode, options.cell_details, options.query)
+
+    # Workbooks above the threshold are searched sheet by sheet on several workers.
+    # Planning (listing sheets, publishing shared strings) runs on a thread here,
+    # since the table must be owned by this process; subinterpreters cannot
+    # attach it, and metadata scans never read sheets
+    split_bytes = options.split_threshold_mb * 1024 * 1024
+    # Shared flags per target, or per query fact
+    flag_count = plan.fact_count if plan is not None else len(targets_set)
+    can_split = split_bytes > 0 and options.mode != "metadata" and backend != "interpreter"
+    planner = None
+    if can_split:
+        planner = ThreadPoolExecutor(max_workers=1,
+                                     initializer=lower_priority if options.background else None,
+                                     initargs=(True,) if options.background else ())
+    sheet_queue = deque()  # (SplitWorkbook, sheet part) waiting for a worker
+    splits = []
+    try:
+        while scan_progress.done_files < scan_progress.total_files and not cancel.cancelled:
+            if read_ahead is not None:
+                # Block briefly only when there is nothing else to do
+                idle = not tasks and not candidates and not sheet_queue
+                candidates.extend(read_ahead.ready(timeout=0.1 if idle else 0))
+
+            worker_limit = load.update() if load is not None else max_workers
+
+            # Sheets of split workbooks go first, so those files finish and free their memory
+            while len(tasks) < worker_limit and sheet_queue:
+                split, (sheet, part) = sheet_queue.popleft()
+                split.queued -= 1
+                split.running += 1
+                fp, buffer, _ = split.item
+                future = submit(scan_sheet, fp, sheet, part, targets_set,
+                                options.case_sensitive, options.use_regex, buffer,
+                                split.table.name, measure_memory, options.mode,
+                                options.cell_details, options.query)
+                tasks[future] = ("sheet", split)
+
+            # Admit files to free workers while they fit the memory budget
+            while len(tasks) < worker_limit:
+                item = budget.pick(candidates)
+                if item is None:
+                    break
+                fp, buffer, _ = item
+                if can_split and file_sizes[fp] >= split_bytes:
+                    tasks[planner.submit(plan_split, fp, buffer, flag_count)] = ("plan", item)
+                else:
+                    tasks[submit_file(item)] = ("file", item)
+
+            if tasks:
+                done, _ = wait(tasks, timeout=0.1, return_when=FIRST_COMPLETED)
+            else:
+                done = ()
+
+            for future in done:
+                kind, state = tasks.pop(future)
+                if kind == "plan":
+                    try:
+                        parts, table = future.result()
+                    except Exception:
+                        # Let the whole-file search report what is wrong with it
+                        parts, table = [], None
+                    if table is None:
+                        tasks[submit_file(state)] = ("file", state)
+                    else:
+                        split = SplitWorkbook(state, table, len(parts), plan)
+                        splits.append(split)
+                        sheet_queue.extend((split, part) for part in parts)
+                    continue
+
+                if kind == "sheet":
+                    split = state
+                    split.running -= 1
+                    split.merge(future)
+                    if split.queued and (split.error or split.decided()
+                                         and not options.cell_details):
+                        # Early exit: nothing left for the remaining sheets to find
+                        for entry in [e for e in sheet_queue if e[0] is split]:
+                            sheet_queue.remove(entry)
+                        split.queued = 0
+                    if split.running or split.queued:
+                        continue
+                    file_path, buffer, estimate = split.item
+                    result = split.result(file_sizes[file_path])
+                    split.table.close(unlink=True)
+                    splits.remove(split)
+                else:
+                    file_path, buffer, estimate = state
+                    result = ScanResult(file_path, size=file_sizes[file_path],
+                                        estimated_memory=estimate)
+                    try:
+                        outcome = future.result()
+                        result.peak_memory = outcome.get("peak_memory")
+                        if "error" in outcome:
+                            result.error = outcome["error"]
+                        else:
+                            result.found = outcome["found"]
+                            result.matched_in = outcome["matched_in"]
+                            result.cells = outcome["cells"]
+                            result.query_match = outcome["query_match"]
+                    except Exception as e:
+                        result.error = str(e)
+
+                budget.release(estimate)
+                if buffer is not None:
+                    read_ahead.release(buffer)
+                scan_progress.advance(file_sizes[file_path])
+                if checkpoint is not None:
+                    checkpoint.record(result)
+                yield result
+
+            if checkpoint is not None:
+                checkpoint.tick()
+
+            # Report progress at a fixed rate, not once per file
+            now = time.monotonic()
+            if progress is not None and (now - last_update >= PROGRESS_INTERVAL
+                                         or scan_progress.done_files == scan_progress.total_files):
+                last_update = now
+                scan_progress.sample()
+                progress(scan_progress)
+    finally:
+        if generation is not None:
+            # Drop this scan's queued tasks and stop its running ones; the workers stay up
+            for future, (kind, _) in tasks.items():
+                if kind != "plan":
+                    future.cancel()
+            pool.release(generation)
+        else:
+            # Running parses finish in the background; queued ones are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+        if planner is not None:
+            for future, (kind, _) in tasks.items():
+                if kind == "plan":
+                    future.add_done_callback(discard_plan)
+            planner.shutdown(wait=False, cancel_futures=True)
+        for split in splits:
+            split.table.close(unlink=True)
+        if checkpoint is not None:
+            checkpoint.close(finished=scan_progress.done_files == scan_progress.total_files)
+        if read_ahead is not None:
+            read_ahead.close()
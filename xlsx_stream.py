@@ -0,0 +1,268 @@
+"""Streaming readers for the XML parts of an .xlsx package
+
+These read straight from the zip members with iterparse, so a sheet is never
+held in memory and the formula text and cached value of a cell come from the
+same pass.
+"""
+import posixpath
+from xml.etree.ElementTree import iterparse
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import from_excel, from_ISO8601, WINDOWS_EPOCH, MAC_EPOCH
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+TAG_ROW = NS_MAIN + "row"
+TAG_CELL = NS_MAIN + "c"
+TAG_VALUE = NS_MAIN + "v"
+TAG_FORMULA = NS_MAIN + "f"
+TAG_INLINE = NS_MAIN + "is"
+TAG_TEXT = NS_MAIN + "t"
+TAG_SI = NS_MAIN + "si"
+TAG_PHONETIC = NS_MAIN + "rPh"
+TAG_SHEET_DATA = NS_MAIN + "sheetData"
+
+def part_text(element):
+    """Text of a shared string or inline string, joining rich text runs"""
+    # Phonetic guides (rPh) are annotations, not part of the cell text
+    parts = []
+    for child in element:
+        if child.tag == TAG_TEXT:
+            parts.append(child.text or "")
+        elif child.tag != TAG_PHONETIC:
+            for t in child.iter(TAG_TEXT):
+                parts.append(t.text or "")
+    return "".join(parts)
+
+def read_relationships(zf, part):
+    """Map relationship ids of a part to the zip paths they point at"""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", name + ".rels")
+    try:
+        f = zf.open(rels_path)
+    except KeyError:
+        return {}
+
+    targets = {}
+    with f:
+        for _, element in iterparse(f):
+            if element.tag == NS_PKG_REL + "Relationship":
+                target = element.get("Target", "")
+                if element.get("TargetMode") == "External":
+                    continue
+                if target.startswith("/"):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join(folder, target))
+                targets[element.get("Id")] = (target, element.get("Type", ""))
+    return targets
+
+def sheet_parts(zf):
+    """List (sheet_name, zip_path) for every worksheet, in workbook order"""
+    rels = read_relationships(zf, "xl/workbook.xml")
+    sheets = []
+    with zf.open("xl/workbook.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == NS_MAIN + "sheet":
+                target, rel_type = rels.get(element.get(NS_REL + "id"), (None, ""))
+                # Chartsheets and dialog sheets have no cells
+                if target and rel_type.endswith("/worksheet"):
+                    sheets.append((element.get("name"), target))
+    return sheets
+
+def read_shared_strings(zf):
+    """Load the shared strings table as a list"""
+    try:
+        f = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+
+    strings = []
+    with f:
+        for _, element in iterparse(f):
+            if element.tag == TAG_SI:
+                strings.append(part_text(element))
+                element.clear()
+    return strings
+
+def read_date_styles(zf):
+    """Find the cell styles that show numbers as dates, and the workbook's date epoch
+
+    Returns ({style index: is_timedelta}, epoch), the style index being the
+    cell's "s" attribute as written. Only needed to turn the serial numbers
+    of date cells into datetimes, as openpyxl does.
+    """
+    epoch = WINDOWS_EPOCH
+    with zf.open("xl/workbook.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == NS_MAIN + "workbookPr":
+                if element.get("date1904") in ("1", "true"):
+                    epoch = MAC_EPOCH
+                break
+
+    try:
+        f = zf.open("xl/styles.xml")
+    except KeyError:
+        return {}, epoch
+
+    formats = dict(BUILTIN_FORMATS)
+    date_styles = {}
+    with f:
+        in_cell_xfs = False
+        index = 0
+        for event, element in iterparse(f, events=("start", "end")):
+            tag = element.tag
+            if tag == NS_MAIN + "cellXfs":
+                in_cell_xfs = event == "start"
+            elif event != "end":
+                continue
+            elif tag == NS_MAIN + "numFmt":
+                formats[int(element.get("numFmtId", -1))] = element.get("formatCode", "")
+            elif tag == NS_MAIN + "xf" and in_cell_xfs:
+                number_format = formats.get(int(element.get("numFmtId", 0)))
+                if number_format and is_date_format(number_format):
+                    date_styles[str(index)] = is_timedelta_format(number_format)
+                index += 1
+    return date_styles, epoch
+
+def _number(text):
+    """Parse a numeric cell; text that is not a number is kept as it is"""
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def _iso_date(text):
+    """Parse a t="d" cell (ISO 8601, as openpyxl writes with iso_dates); unparseable text is kept"""
+    try:
+        return from_ISO8601(text)
+    except (ValueError, TypeError):
+        return text
+
+def iter_sheet_rows(zf, part, shared_strings, refs=False, dates=None):
+    """Yield each row of a worksheet as a list of (value, formula) pairs
+
+    value is the cached value openpyxl would return with data_only=True
+    (str, int, float or bool, or None), and formula is the formula text
+    without the leading "=" or None. Cells that continue a shared formula
+    report the master cell's text. With refs, each cell is a
+    (value, formula, reference) triple, reference being e.g. "B12".
+    Cells typed as ISO 8601 dates (t="d") are datetimes. Dates stored as
+    serial numbers stay numbers unless dates, the result of
+    read_date_styles, is given; then they are datetimes (or time or
+    timedelta values) like openpyxl's. A value that does not parse as its
+    type is returned as text rather than failing the sheet.
+    """
+    date_styles, epoch = dates or ({}, None)
+    shared_formulas = {}
+    with zf.open(part) as f:
+        context = iterparse(f, events=("start", "end"))
+        sheet_data = None
+        for event, element in context:
+            if event == "start":
+                if element.tag == TAG_SHEET_DATA:
+                    sheet_data = element
+                continue
+            if element.tag != TAG_ROW:
+                continue
+
+            row = []
+            for cell in element:
+                if cell.tag != TAG_CELL:
+                    continue
+                cell_type = cell.get("t", "n")
+                value = formula = None
+                for child in cell:
+                    tag = child.tag
+                    if tag == TAG_VALUE:
+                        text = child.text
+                        if text is None:
+                            continue
+                        if cell_type == "s":
+                            value = shared_strings[int(text)]
+                        elif cell_type in ("str", "e"):
+                            value = text
+                        elif cell_type == "b":
+                            value = text == "1"
+                        elif cell_type == "d":
+                            value = _iso_date(text)
+                        else:
+                            value = _number(text)
+                            style = cell.get("s") if date_styles else None
+                            if style in date_styles and not isinstance(value, str):
+                                try:
+                                    value = from_excel(value, epoch, timedelta=date_styles[style])
+                                except (ValueError, OverflowError):
+                                    # Out of the calendar's range; keep the number
+                                    pass
+                    elif tag == TAG_FORMULA:
+                        formula = child.text
+                        if child.get("t") == "shared":
+                            index = child.get("si")
+                            if formula:
+                                shared_formulas[index] = formula
+                            else:
+                                formula = shared_formulas.get(index)
+                    elif tag == TAG_INLINE:
+                        value = part_text(child)
+                row.append((value, formula, cell.get("r")) if refs else (value, formula))
+            yield row
+
+            # Drop finished rows so memory stays flat however long the sheet is
+            if sheet_data is not None:
+                sheet_data.clear()
+            else:
+                element.clear()
+
+# Document properties searched in metadata mode, by element local name
+CORE_PROPERTIES = ("title", "subject", "keywords", "description")
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def iter_metadata(zf):
+    """Yield (location, text) for sheet names, defined names, cell comments and document properties
+
+    Only workbook.xml, the comment parts and docProps are read; sheet XML is
+    never opened.
+    """
+    with zf.open("xl/workbook.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == NS_MAIN + "sheet":
+                yield "sheet name", element.get("name", "")
+            elif element.tag == NS_MAIN + "definedName":
+                yield "defined name", element.get("name", "")
+                if element.text:
+                    yield "defined name", element.text
+
+    for name in zf.namelist():
+        if name.startswith("xl/comments") and name.endswith(".xml"):
+            # Legacy notes: one <comment> with rich text runs per cell
+            text_tag = NS_MAIN + "comment"
+        elif name.startswith("xl/threadedComments/") and name.endswith(".xml"):
+            text_tag = None
+        else:
+            continue
+        with zf.open(name) as f:
+            for _, element in iterparse(f):
+                if text_tag is not None and element.tag == text_tag:
+                    yield "comment", "".join(t.text or "" for t in element.iter(TAG_TEXT))
+                    element.clear()
+                elif text_tag is None and _local_name(element.tag) == "text":
+                    yield "comment", element.text or ""
+
+    try:
+        f = zf.open("docProps/core.xml")
+    except KeyError:
+        return
+    with f:
+        for _, element in iterparse(f):
+            name = _local_name(element.tag)
+            if name in CORE_PROPERTIES and element.text:
+                yield name, element.text